@@ -1,175 +1,319 @@
-from datetime import datetime, timedelta, timezone
-from typing import Annotated
+import asyncio
+import logging
+import time
+from collections.abc import Coroutine
+from dataclasses import dataclass
+from typing import Annotated, Any
 
 import httpx
+import jwt
+import orjson
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import TTLCache
 from app.config import get_settings
 from app.database import get_db
 from app.models import User
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 security = HTTPBearer()
 
+# Pre-encoded once; PyJWT would otherwise encode the str key on every call
+_SECRET = settings.secret_key.encode("utf-8")
+_ALG = settings.algorithm
+_ACCESS_TTL = settings.access_token_expire_minutes * 60
+_MAGIC_TTL = settings.magic_link_expire_minutes * 60
+_INVITE_TTL = settings.group_invite_expire_days * 86400
+
+# Decoded payloads of tokens that passed verification, keyed by the raw token.
+# Each entry expires together with its token.
+_verified_tokens: TTLCache[dict] = TTLCache(
+    maxsize=10_000, ttl=_ACCESS_TTL
+)
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """The user fields pages need, detached from any session."""
+
+    id: int
+    email: str
+    display_name: str | None
+
+
+# Signed-in users for cookie-authenticated pages, keyed by user id. Kept
+# short so profile changes made through other workers show up soon.
+_cached_users: TTLCache[CachedUser] = TTLCache(maxsize=10_000, ttl=300)
+
+# Per-request user lookups, built once at import
+_STMT_USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+_STMT_CACHED_USER = select(User.id, User.email, User.display_name).where(
+    User.id == bindparam("user_id")
+)
+
+# Claims each token type must carry besides "type" and "exp"
+_REQUIRED_CLAIMS: dict[str, tuple[str, ...]] = {
+    "access": ("sub",),
+    "magic_link": ("sub",),
+    "group_invite": ("email", "group_id"),
+}
+
+
+def _decode_token(token: str, token_type: str) -> dict | None:
+    """
+    Decode and verify a JWT of the given type.
+    Returns the payload, or None if the token is invalid, expired,
+    missing required claims, or of a different type.
+    """
+    payload = _verified_tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(
+                token,
+                _SECRET,
+                algorithms=[_ALG],
+                options={"require": ["exp", "type"]},
+            )
+        except jwt.PyJWTError:
+            return None
+
+        required = _REQUIRED_CLAIMS.get(payload["type"])
+        if required is None or any(payload.get(claim) is None for claim in required):
+            return None
+        _verified_tokens.set(token, payload, expires_at=payload["exp"])
+
+    if payload["type"] != token_type:
+        return None
+    return payload
+
 
 def create_magic_link_token(email: str) -> str:
-    expire = datetime.now(timezone.utc) + timedelta(
-        minutes=settings.magic_link_expire_minutes
+    return jwt.encode(
+        {"sub": email, "type": "magic_link", "exp": int(time.time()) + _MAGIC_TTL},
+        _SECRET,
+        algorithm=_ALG,
     )
-    to_encode = {"sub": email, "type": "magic_link", "exp": expire}
-    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
 def verify_magic_link_token(token: str) -> str | None:
-    try:
-        payload = jwt.decode(
-            token, settings.secret_key, algorithms=[settings.algorithm]
-        )
-        email: str = payload.get("sub")
-        token_type: str = payload.get("type")
-        if email is None or token_type != "magic_link":
-            return None
-        return email
-    except JWTError:
+    payload = _decode_token(token, "magic_link")
+    if payload is None:
         return None
+    return payload["sub"]
 
 
 def create_access_token(user_id: int) -> str:
-    expire = datetime.now(timezone.utc) + timedelta(
-        minutes=settings.access_token_expire_minutes
+    return jwt.encode(
+        {"sub": str(user_id), "type": "access", "exp": int(time.time()) + _ACCESS_TTL},
+        _SECRET,
+        algorithm=_ALG,
     )
-    to_encode = {"sub": str(user_id), "type": "access", "exp": expire}
-    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
 def verify_access_token(token: str) -> int | None:
-    try:
-        payload = jwt.decode(
-            token, settings.secret_key, algorithms=[settings.algorithm]
-        )
-        user_id: str = payload.get("sub")
-        token_type: str = payload.get("type")
-        if user_id is None or token_type != "access":
-            return None
-        return int(user_id)
-    except JWTError:
+    payload = _decode_token(token, "access")
+    if payload is None:
         return None
+    return int(payload["sub"])
 
 
-async def get_current_user(
-    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-) -> User:
-    token = credentials.credentials
-    user_id = verify_access_token(token)
+def _user_id_from_credentials(credentials: HTTPAuthorizationCredentials) -> int:
+    user_id = verify_access_token(credentials.credentials)
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return user_id
+
+
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="User not found",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+async def get_current_user(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> User:
+    user_id = _user_id_from_credentials(credentials)
+
+    user = await db.scalar(_STMT_USER_BY_ID, {"user_id": user_id})
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _user_not_found()
+
+    return user
+
 
+async def get_current_user_id(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+) -> int:
+    """Get the current user's id from the access token, without a DB lookup."""
+    return _user_id_from_credentials(credentials)
+
+
+async def get_cached_user(db: AsyncSession, user_id: int) -> CachedUser | None:
+    """Look up a user's page fields, going to the database only on a cache miss."""
+    user = _cached_users.get(user_id)
+    if user is None:
+        row = (await db.execute(_STMT_CACHED_USER, {"user_id": user_id})).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        _cached_users.set(user_id, user)
     return user
 
 
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop a cached user after their profile changes."""
+    _cached_users.delete(user_id)
+
+
+_FROM_ADDRESS = f"{settings.email_from_name} <{settings.email_from_address}>"
+
+# Shared Resend client so sends reuse pooled keep-alive connections
+_resend_client: httpx.AsyncClient | None = None
+
+
+def get_resend_client() -> httpx.AsyncClient:
+    """Return the shared Resend HTTP client, creating it on first use."""
+    global _resend_client
+    if _resend_client is None:
+        _resend_client = httpx.AsyncClient(
+            base_url="https://api.resend.com",
+            headers={
+                "Authorization": f"Bearer {settings.resend_api_key}",
+                "Content-Type": "application/json",
+            },
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+    return _resend_client
+
+
+async def close_resend_client() -> None:
+    """Close the shared Resend HTTP client, if it was ever opened."""
+    global _resend_client
+    if _resend_client is not None:
+        await _resend_client.aclose()
+        _resend_client = None
+
+
+# Emails sent off the request path; strong refs keep the tasks from being GC'd
+_pending_sends: set[asyncio.Task] = set()
+# Cap concurrent Resend calls
+_send_slots = asyncio.Semaphore(50)
+
+
+def send_in_background(send: Coroutine[Any, Any, bool]) -> None:
+    """Schedule an email send without making the caller wait for Resend."""
+
+    async def run() -> None:
+        async with _send_slots:
+            await send
+
+    task = asyncio.create_task(run())
+    _pending_sends.add(task)
+    task.add_done_callback(_on_send_done)
+
+
+def _on_send_done(task: asyncio.Task) -> None:
+    _pending_sends.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background email send failed", exc_info=task.exception())
+
+
+async def wait_for_pending_sends() -> None:
+    """Wait for queued background email sends to finish."""
+    if _pending_sends:
+        await asyncio.gather(*_pending_sends, return_exceptions=True)
+
+
+async def _send_email(to: str, subject: str, text: str) -> bool:
+    """
+    Send a plain-text email via Resend.
+    Returns True if sent successfully, False otherwise.
+    """
+    data = {
+        "from": _FROM_ADDRESS,
+        "to": [to],
+        "subject": subject,
+        "text": text,
+    }
+    try:
+        response = await get_resend_client().post("/emails", content=orjson.dumps(data))
+    except Exception as e:
+        logger.warning("Failed to send email: %s", e)
+        return False
+
+    if response.status_code != 200:
+        logger.warning("Resend error (%s): %s", response.status_code, response.text)
+        return False
+    return True
+
+
 async def send_magic_link_email(email: str, magic_link: str) -> bool:
     """
     Send magic link via Resend.
     Returns True if sent successfully, False otherwise.
-    Falls back to console printing if not configured.
+    Falls back to logging the link if not configured.
     """
-    cfg = get_settings()
-    if not cfg.email_enabled:
-        _print_magic_link_to_console(email, magic_link)
+    if not settings.email_enabled:
+        _log_magic_link(email, magic_link)
         return True
 
-    try:
-        url = "https://api.resend.com/emails"
-        headers = {
-            "Authorization": f"Bearer {cfg.resend_api_key}",
-            "Content-Type": "application/json",
-        }
-
-        body = f"""Hello!
+    body = f"""Hello!
 
 Click the link below to sign in to Forecast Club:
 
 {magic_link}
 
-This link will expire in {cfg.magic_link_expire_minutes} minutes.
+This link will expire in {settings.magic_link_expire_minutes} minutes.
 
 If you didn't request this, you can safely ignore this email.
 
 - Forecast Club"""
 
-        from_address = f"{cfg.email_from_name} <{cfg.email_from_address}>"
-        data = {
-            "from": from_address,
-            "to": [email],
-            "subject": "Sign in to Forecast Club",
-            "text": body,
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=data)
-
-        if response.status_code == 200:
-            return True
-        else:
-            print(f"Resend error ({response.status_code}): {response.text}")
-            _print_magic_link_to_console(email, magic_link)
-            return False
-
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        _print_magic_link_to_console(email, magic_link)
-        return False
+    if await _send_email(email, "Sign in to Forecast Club", body):
+        return True
+    _log_magic_link(email, magic_link)
+    return False
 
 
-def _print_magic_link_to_console(email: str, magic_link: str) -> None:
-    """Print magic link to console for development."""
-    print(f"\n{'='*50}")
-    print(f"Magic link for {email}:")
-    print(magic_link)
-    print(f"{'='*50}\n")
+def _log_magic_link(email: str, magic_link: str) -> None:
+    """Log the magic link for development."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("magic_link email=%s url=%s", email, magic_link)
 
 
 def create_group_invite_token(email: str, group_id: int) -> str:
     """Create a JWT token encoding email + group_id for group invitations."""
-    expire = datetime.now(timezone.utc) + timedelta(
-        days=settings.group_invite_expire_days
+    return jwt.encode(
+        {
+            "email": email,
+            "group_id": group_id,
+            "type": "group_invite",
+            "exp": int(time.time()) + _INVITE_TTL,
+        },
+        _SECRET,
+        algorithm=_ALG,
     )
-    to_encode = {"email": email, "group_id": group_id, "type": "group_invite", "exp": expire}
-    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
 def verify_group_invite_token(token: str) -> tuple[str, int] | None:
     """Verify and decode a group invite token. Returns (email, group_id) or None."""
-    try:
-        payload = jwt.decode(
-            token, settings.secret_key, algorithms=[settings.algorithm]
-        )
-        email: str = payload.get("email")
-        group_id: int = payload.get("group_id")
-        token_type: str = payload.get("type")
-        if email is None or group_id is None or token_type != "group_invite":
-            return None
-        return (email, group_id)
-    except JWTError:
+    payload = _decode_token(token, "group_invite")
+    if payload is None:
         return None
+    return (payload["email"], payload["group_id"])
 
 
 async def send_group_invite_email(
@@ -179,19 +323,11 @@ async def send_group_invite_email(
     Send group invitation email via Resend.
     Returns True if sent successfully, False otherwise.
     """
-    cfg = get_settings()
-    if not cfg.email_enabled:
-        _print_invite_link_to_console(email, inviter_name, group_name, invite_link)
+    if not settings.email_enabled:
+        _log_invite_link(email, inviter_name, group_name, invite_link)
         return True
 
-    try:
-        url = "https://api.resend.com/emails"
-        headers = {
-            "Authorization": f"Bearer {cfg.resend_api_key}",
-            "Content-Type": "application/json",
-        }
-
-        body = f"""Hi!
+    body = f"""Hi!
 
 {inviter_name} invited you to join '{group_name}' on Forecast Club.
 
@@ -199,41 +335,25 @@ Click the link below to join:
 
 {invite_link}
 
-This link will expire in {cfg.group_invite_expire_days} days.
+This link will expire in {settings.group_invite_expire_days} days.
 
 - Forecast Club"""
 
-        from_address = f"{cfg.email_from_name} <{cfg.email_from_address}>"
-        data = {
-            "from": from_address,
-            "to": [email],
-            "subject": f"Join '{group_name}' on Forecast Club",
-            "text": body,
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=data)
-
-        if response.status_code == 200:
-            return True
-        else:
-            print(f"Resend error ({response.status_code}): {response.text}")
-            _print_invite_link_to_console(email, inviter_name, group_name, invite_link)
-            return False
-
-    except Exception as e:
-        print(f"Failed to send invite email: {e}")
-        _print_invite_link_to_console(email, inviter_name, group_name, invite_link)
-        return False
+    if await _send_email(email, f"Join '{group_name}' on Forecast Club", body):
+        return True
+    _log_invite_link(email, inviter_name, group_name, invite_link)
+    return False
 
 
-def _print_invite_link_to_console(
+def _log_invite_link(
     email: str, inviter_name: str, group_name: str, invite_link: str
 ) -> None:
-    """Print invite link to console for development."""
-    print(f"\n{'='*50}")
-    print(f"Group invite for {email}:")
-    print(f"Invited by: {inviter_name}")
-    print(f"Group: {group_name}")
-    print(invite_link)
-    print(f"{'='*50}\n")
+    """Log the group invite link for development."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "group_invite email=%s inviter=%s group=%s url=%s",
+            email,
+            inviter_name,
+            group_name,
+            invite_link,
+        )
@@ -20,6 +20,16 @@ class Settings(BaseSettings):
             return url.replace("postgres://", "postgresql+asyncpg://", 1)
         return url
 
+    # Connection pool (applied to PostgreSQL only)
+    db_pool_size: int = 25
+    db_max_overflow: int = 25
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800  # seconds
+    # Prepared statements cached per connection (asyncpg)
+    db_statement_cache_size: int = 256
+    # Set when connecting through PgBouncer in transaction pooling mode
+    db_pgbouncer: bool = False
+
     # Auth
     secret_key: str
     access_token_expire_minutes: int = 43200  # 30 days
@@ -35,6 +45,8 @@ class Settings(BaseSettings):
     # App
     debug: bool = False
     base_url: str = "http://localhost:8000"
+    # Compiled templates persist here across restarts; empty uses a temp dir
+    template_cache_dir: str = ""
 
     @property
     def email_enabled(self) -> bool:
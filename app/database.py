@@ -1,17 +1,78 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
 
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session, SessionTransaction
+from sqlalchemy.pool import NullPool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _engine_options() -> dict:
+    """Pool options for the configured database."""
+    if not settings.async_database_url.startswith("postgresql"):
+        # SQLite: keep SQLAlchemy's default pool for the driver
+        return {}
+
+    # Hot point lookups are parameterized, so prepared statements skip
+    # re-parsing and planning. Transaction pooling can hand each statement a
+    # different server connection, so behind PgBouncer they must be off
+    cache_size = 0 if settings.db_pgbouncer else settings.db_statement_cache_size
+    connect_args = {
+        "statement_cache_size": cache_size,
+        "prepared_statement_cache_size": cache_size,
+    }
+    if settings.db_pgbouncer:
+        # PgBouncer does the pooling; a second pool here would only pin its slots
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+        "connect_args": connect_args,
+    }
+
 
 engine = create_async_engine(
     settings.async_database_url,
     echo=settings.debug,
+    **_engine_options(),
 )
 
+
+async def warm_pool() -> None:
+    """
+    Open the PostgreSQL pool's connections at startup, so the first requests
+    don't each pay for a TCP/TLS handshake and authentication.
+    """
+    if engine.dialect.name != "postgresql" or settings.db_pgbouncer:
+        return
+    results = await asyncio.gather(
+        *(engine.connect() for _ in range(settings.db_pool_size)),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        # Requests connect lazily anyway; don't stop startup over it
+        logger.warning("Could not warm the database pool", exc_info=failures[0])
+    # Closing hands the connections back to the pool, still open
+    await asyncio.gather(
+        *(result.close() for result in results if not isinstance(result, BaseException))
+    )
+
+
 async_session_maker = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -23,11 +84,103 @@ class Base(DeclarativeBase):
     pass
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
+def dialect_insert(session: AsyncSession, entity: type[Base]) -> postgresql.Insert | sqlite.Insert:
+    """INSERT for the session's database, with its ON CONFLICT clauses available."""
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(entity)
+    return sqlite.insert(entity)
+
+
+_AFTER_COMMIT = "after_commit"
+
+
+def after_commit(session: AsyncSession, callback: Callable[..., None], *args: object) -> None:
+    """
+    Call callback(*args) once the session's transaction commits, e.g. to drop
+    cached copies of what it wrote. Dropped if the transaction rolls back, so
+    no reader can refill a cache with data that was never committed.
+    """
+    session.info.setdefault(_AFTER_COMMIT, []).append((callback, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback, args in session.info.pop(_AFTER_COMMIT, ()):
+        callback(*args)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_after_commit(session: Session, previous_transaction: SessionTransaction) -> None:
+    # A rolled-back SAVEPOINT leaves the outer transaction's callbacks pending
+    if previous_transaction.parent is None:
+        session.info.pop(_AFTER_COMMIT, None)
+
+
+@dataclass
+class _RequestDB:
+    session: AsyncSession | None = None
+
+
+_request_db: ContextVar[_RequestDB | None] = ContextVar("request_db", default=None)
+
+
+class DBSessionMiddleware:
+    """
+    Own one database session per HTTP request.
+    The session is opened lazily by get_db, then committed (or rolled back
+    for error responses) and closed just before the response starts, so its
+    connection is back in the pool before the body is sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = _RequestDB()
+        token = _request_db.set(state)
+
+        async def finish(commit: bool) -> None:
+            session, state.session = state.session, None
+            if session is None:
+                return
+            try:
+                if commit:
+                    await session.commit()
+                else:
+                    await session.rollback()
+            finally:
+                await session.close()
+
+        async def send_after_finishing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                await finish(commit=message["status"] < 400)
+            await send(message)
+
         try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
+            await self.app(scope, receive, send_after_finishing)
+        finally:
+            # Only reached with a live session if the app raised before responding
+            await finish(commit=False)
+            _request_db.reset(token)
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    state = _request_db.get()
+    if state is None:
+        # Outside DBSessionMiddleware: manage a session for this caller only
+        async with async_session_maker() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return
+
+    if state.session is None:
+        state.session = async_session_maker()
+    yield state.session
@@ -0,0 +1,15 @@
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether an If-None-Match header value matches etag, so a 304 may be sent.
+
+    The header may list several tags or be "*". Tags are compared weakly, as
+    RFC 9110 requires for If-None-Match: W/"x" matches "x".
+    """
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
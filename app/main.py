@@ -1,8 +1,13 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from app.auth import close_resend_client, wait_for_pending_sends
 from app.config import get_settings
+from app.database import DBSessionMiddleware, warm_pool
 from app.routers import (
     auth_router,
     forecasts_router,
@@ -11,15 +16,32 @@ from app.routers import (
     stats_router,
 )
 from app.routers.pages import router as pages_router
+from app.templating import warm_templates
 
 settings = get_settings()
 
+# Surface dev-only INFO logs (e.g. magic links when email is not configured)
+if settings.debug:
+    logging.basicConfig(level=logging.INFO)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_templates()
+    await warm_pool()
+    yield
+    await wait_for_pending_sends()
+    await close_resend_client()
+
+
 app = FastAPI(
     title="Forecast Club",
     description="Prediction tracking app for private groups",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+app.add_middleware(DBSessionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"] if settings.debug else [],
@@ -1,10 +1,26 @@
 import enum
 import secrets
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Enum, Float, ForeignKey, String, Text, func
+from sqlalchemy import (
+    Boolean,
+    ColumnElement,
+    DateTime,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    String,
+    Text,
+    func,
+    literal,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 from app.database import Base
 
@@ -28,6 +44,67 @@ def generate_invite_code() -> str:
     return secrets.token_urlsafe(8)
 
 
+def _to_epoch(value: datetime) -> float:
+    """UNIX timestamp of a datetime; naive values are stored as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class interpolate_datetime(FunctionElement):
+    """
+    SQL datetime `fraction` of the way from `start` to `end`:
+    interpolate_datetime(start, end, fraction).
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(interpolate_datetime)
+def _compile_interpolate_datetime(element, compiler, **kw) -> str:
+    start, end, fraction = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"({start} + ({end} - {start}) * {fraction})"
+
+
+def _julianday_sqlite(element, compiler, **kw) -> str:
+    """SQLite Julian day of a datetime expression, at full precision."""
+    if isinstance(element, interpolate_datetime):
+        start, end, fraction = (compiler.process(arg, **kw) for arg in element.clauses)
+        return f"(julianday({start}) + (julianday({end}) - julianday({start})) * {fraction})"
+    return f"julianday({compiler.process(element, **kw)})"
+
+
+@compiles(interpolate_datetime, "sqlite")
+def _compile_interpolate_datetime_sqlite(element, compiler, **kw) -> str:
+    # Same text format SQLAlchemy stores, so it compares with datetime columns
+    return f"strftime('%Y-%m-%d %H:%M:%f', {_julianday_sqlite(element, compiler, **kw)})"
+
+
+class datetime_before(FunctionElement):
+    """
+    SQL test that datetime `value` is earlier than `deadline`:
+    datetime_before(value, deadline).
+    """
+
+    type = Boolean()
+    inherit_cache = True
+
+
+@compiles(datetime_before)
+def _compile_datetime_before(element, compiler, **kw) -> str:
+    value, deadline = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"{value} < {deadline}"
+
+
+@compiles(datetime_before, "sqlite")
+def _compile_datetime_before_sqlite(element, compiler, **kw) -> str:
+    # As Julian days: an interpolated deadline rendered as text is rounded to
+    # the millisecond, which would make earlier values in that millisecond late
+    value, deadline = (_julianday_sqlite(arg, compiler, **kw) for arg in element.clauses)
+    return f"{value} < {deadline}"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -64,6 +141,12 @@ class Group(Base):
 
 class GroupMembership(Base):
     __tablename__ = "group_memberships"
+    __table_args__ = (
+        # One membership per user per group; serves group-side lookups
+        Index("uq_memberships_group_user", "group_id", "user_id", unique=True),
+        # Serves "my groups" lookups that start from the user
+        Index("ix_memberships_user_group", "user_id", "group_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
@@ -78,6 +161,10 @@ class GroupMembership(Base):
 
 class Prediction(Base):
     __tablename__ = "predictions"
+    __table_args__ = (
+        # Group listings and resolved-only scoring filters
+        Index("ix_prediction_group_status", "group_id", "status"),
+    )
 
     # Lock-in at 75% of time elapsed (last 25% is locked)
     LOCK_IN_PERCENTAGE = 0.75
@@ -102,28 +189,57 @@ class Prediction(Base):
         back_populates="prediction", cascade="all, delete-orphan"
     )
 
-    @property
+    @hybrid_property
     def lock_in_at(self) -> datetime:
-        """Calculate lock-in deadline: 75% of time from creation to resolution."""
-        total_duration = (self.resolution_date - self.created_at).total_seconds()
-        lock_in_seconds = total_duration * self.LOCK_IN_PERCENTAGE
-        return self.created_at + timedelta(seconds=lock_in_seconds)
+        """Lock-in deadline: 75% of time from creation to resolution."""
+        lock_in = datetime.fromtimestamp(self._lock_in_epoch, tz=timezone.utc)
+        # Stay comparable with created_at, which is stored as naive UTC
+        if self.created_at.tzinfo is None:
+            return lock_in.replace(tzinfo=None)
+        return lock_in
+
+    @property
+    def _lock_in_epoch(self) -> float:
+        """Lock-in deadline as a UNIX timestamp, from the current dates."""
+        created = _to_epoch(self.created_at)
+        resolution = _to_epoch(self.resolution_date)
+        return created + (resolution - created) * self.LOCK_IN_PERCENTAGE
+
+    @lock_in_at.inplace.expression
+    @classmethod
+    def _lock_in_at_expression(cls) -> ColumnElement[datetime]:
+        return interpolate_datetime(
+            cls.created_at, cls.resolution_date, literal(cls.LOCK_IN_PERCENTAGE)
+        )
 
     @property
     def is_locked(self) -> bool:
         """Check if forecasts are locked (past lock-in deadline)."""
-        return datetime.utcnow() >= self.lock_in_at
+        return time.time() >= self._lock_in_epoch
 
     @property
     def time_until_lock(self) -> timedelta | None:
         """Time remaining until lock-in, or None if already locked."""
-        if self.is_locked:
+        remaining = self._lock_in_epoch - time.time()
+        if remaining <= 0:
             return None
-        return self.lock_in_at - datetime.utcnow()
+        return timedelta(seconds=remaining)
 
 
 class Forecast(Base):
     __tablename__ = "forecasts"
+    __table_args__ = (
+        # One forecast per user per prediction; also serves the duplicate lookup
+        Index("uq_forecast_pred_user", "prediction_id", "user_id", unique=True),
+        # Range scans for forecasts made before a prediction's lock-in
+        Index("ix_forecast_pred_created", "prediction_id", "created_at"),
+        # Per-user stats, and "my forecasts" newest first
+        Index("ix_forecast_user_pred", "user_id", "prediction_id"),
+        Index("ix_forecast_user_created", "user_id", "created_at"),
+    )
+    # Fetch updated_at with RETURNING on UPDATE too, so a flushed forecast
+    # can be serialized without another SELECT
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(primary_key=True)
     prediction_id: Mapped[int] = mapped_column(
@@ -131,6 +247,9 @@ class Forecast(Base):
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     probability: Mapped[float] = mapped_column(Float)
+    # Stored when the prediction resolves, for locked-in forecasts on a yes/no
+    # outcome; NULL otherwise
+    brier_score: Mapped[float | None] = mapped_column(Float)
     reasoning: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
@@ -140,3 +259,12 @@ class Forecast(Base):
     # Relationships
     prediction: Mapped["Prediction"] = relationship(back_populates="forecasts")
     user: Mapped["User"] = relationship(back_populates="forecasts")
+
+
+# Forecast was made before its prediction's lock-in deadline, as SQL (needs
+# both tables). Outside SQLite, created_at stays bare so
+# ix_forecast_pred_created serves the range scan; as_comparison() keeps it a
+# plain comparison rather than "... = 1" on SQLite.
+forecast_locked_in = datetime_before(
+    Forecast.created_at, Prediction.lock_in_at
+).as_comparison(1, 2)
@@ -0,0 +1,50 @@
+import math
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, status
+
+from app.auth import get_current_user_id
+from app.cache import TTLCache
+
+
+class RateLimiter:
+    """
+    Fixed-window request counter, held in process.
+
+    Each key may make `limit` calls per `window` seconds; the window starts
+    at the key's first call. Limits are per worker process.
+    """
+
+    def __init__(self, limit: int, window: float, maxsize: int = 10_000) -> None:
+        self.limit = limit
+        self.window = window
+        # key -> (window end, calls so far); the entry expires with its window
+        self._windows: TTLCache[tuple[float, int]] = TTLCache(maxsize, ttl=window)
+
+    def hit(self, key: Hashable) -> bool:
+        """Record a call for key. Returns False once the window's limit is spent."""
+        now = time.time()
+        window_end, calls = self._windows.get(key) or (now + self.window, 0)
+        if calls >= self.limit:
+            return False
+        self._windows.set(key, (window_end, calls + 1), expires_at=window_end)
+        return True
+
+    def clear(self) -> None:
+        self._windows.clear()
+
+
+def rate_limit(limiter: RateLimiter) -> Callable[..., Awaitable[None]]:
+    """Dependency that applies limiter to the authenticated user."""
+
+    async def check(user_id: Annotated[int, Depends(get_current_user_id)]) -> None:
+        if not limiter.hit(user_id):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again shortly",
+                headers={"Retry-After": str(math.ceil(limiter.window))},
+            )
+
+    return check
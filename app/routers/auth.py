@@ -1,6 +1,7 @@
+import hashlib
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -8,31 +9,42 @@ from app.auth import (
     create_access_token,
     create_magic_link_token,
     get_current_user,
+    invalidate_cached_user,
+    send_in_background,
     send_magic_link_email,
     verify_magic_link_token,
 )
 from app.config import get_settings
-from app.database import get_db
+from app.database import after_commit, get_db
+from app.etag import etag_matches
 from app.models import User
 from app.schemas import MagicLinkRequest, TokenResponse, UserResponse, UserUpdate
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
 
+# Browsers may reuse /me for this long without asking again
+ME_CACHE_CONTROL = "private, max-age=30"
+
+
+def _user_etag(user: User) -> str:
+    """Strong ETag over the user fields returned by /me."""
+    digest = hashlib.blake2b(
+        f"{user.id}:{user.email}:{user.display_name}".encode(), digest_size=8
+    ).hexdigest()
+    return f'"{digest}"'
+
 
 @router.post("/magic-link")
-async def request_magic_link(
-    request: MagicLinkRequest,
-    db: Annotated[AsyncSession, Depends(get_db)],
-) -> dict:
+async def request_magic_link(payload: MagicLinkRequest) -> dict:
     """
     Request a magic link for email-based authentication.
-    Sends email via SendGrid, falls back to console in dev.
+    Sends email via Resend, falls back to logging the link in dev.
     """
-    token = create_magic_link_token(request.email)
+    token = create_magic_link_token(payload.email)
     magic_link = f"{settings.base_url}/auth/verify?token={token}"
 
-    await send_magic_link_email(request.email, magic_link)
+    send_in_background(send_magic_link_email(payload.email, magic_link))
 
     return {"message": "Magic link sent to your email"}
 
@@ -53,8 +65,7 @@ async def verify_magic_link(
             detail="Invalid or expired magic link",
         )
 
-    result = await db.execute(select(User).where(User.email == email))
-    user = result.scalar_one_or_none()
+    user = await db.scalar(select(User).where(User.email == email))
 
     if user is None:
         user = User(email=email)
@@ -67,9 +78,21 @@ async def verify_magic_link(
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(
+    request: Request,
+    response: Response,
     current_user: Annotated[User, Depends(get_current_user)],
-) -> User:
-    """Get the current authenticated user."""
+) -> User | Response:
+    """
+    Get the current authenticated user.
+    Answers 304 when the client's If-None-Match still matches.
+    """
+    etag = _user_etag(current_user)
+    headers = {"Cache-Control": ME_CACHE_CONTROL, "ETag": etag, "Vary": "Authorization"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
     return current_user
 
 
@@ -82,4 +105,5 @@ async def update_me(
     """Update the current user's profile."""
     if update.display_name is not None:
         current_user.display_name = update.display_name
+        after_commit(db, invalidate_cached_user, current_user.id)
     return current_user
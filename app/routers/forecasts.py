@@ -1,14 +1,15 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth import get_current_user
-from app.database import get_db
-from app.models import Forecast, Prediction, PredictionStatus, User
-from app.routers.groups import get_membership
+from app.auth import get_current_user_id
+from app.database import after_commit, get_db
+from app.models import Forecast, GroupMembership, Prediction, PredictionStatus
 from app.schemas import ForecastCreate, ForecastResponse, ForecastUpdate
+from app.templating import bump_group_version
 
 router = APIRouter(prefix="/forecasts", tags=["forecasts"])
 
@@ -16,26 +17,41 @@ router = APIRouter(prefix="/forecasts", tags=["forecasts"])
 @router.post("", response_model=ForecastResponse, status_code=status.HTTP_201_CREATED)
 async def create_forecast(
     forecast_data: ForecastCreate,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Forecast:
     """
     Add a forecast to a prediction.
     Can only forecast on open predictions.
     """
+    # Prediction, caller's membership and any existing forecast in one round trip
     result = await db.execute(
-        select(Prediction).where(Prediction.id == forecast_data.prediction_id)
+        select(
+            Prediction,
+            exists()
+            .where(
+                GroupMembership.group_id == Prediction.group_id,
+                GroupMembership.user_id == user_id,
+            )
+            .label("is_member"),
+            exists()
+            .where(
+                Forecast.prediction_id == Prediction.id,
+                Forecast.user_id == user_id,
+            )
+            .label("has_forecast"),
+        ).where(Prediction.id == forecast_data.prediction_id)
     )
-    prediction = result.scalar_one_or_none()
+    row = result.first()
 
-    if prediction is None:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Prediction not found",
         )
 
-    membership = await get_membership(db, prediction.group_id, current_user.id)
-    if membership is None:
+    prediction = row.Prediction
+    if not row.is_member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this group",
@@ -53,13 +69,7 @@ async def create_forecast(
             detail="Forecasts are locked for this prediction",
         )
 
-    existing = await db.execute(
-        select(Forecast).where(
-            Forecast.prediction_id == forecast_data.prediction_id,
-            Forecast.user_id == current_user.id,
-        )
-    )
-    if existing.scalar_one_or_none() is not None:
+    if row.has_forecast:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You already have a forecast for this prediction. Use PATCH to update.",
@@ -67,12 +77,20 @@ async def create_forecast(
 
     forecast = Forecast(
         prediction_id=forecast_data.prediction_id,
-        user_id=current_user.id,
+        user_id=user_id,
         probability=forecast_data.probability,
         reasoning=forecast_data.reasoning,
     )
     db.add(forecast)
-    await db.flush()
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A concurrent request inserted this user's forecast after our check
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You already have a forecast for this prediction. Use PATCH to update.",
+        )
+    after_commit(db, bump_group_version, prediction.group_id)
     return forecast
 
 
@@ -80,17 +98,16 @@ async def create_forecast(
 async def update_forecast(
     forecast_id: int,
     update_data: ForecastUpdate,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Forecast:
     """
     Update an existing forecast.
     Can only update your own forecasts on open predictions.
     """
-    result = await db.execute(
+    forecast = await db.scalar(
         select(Forecast).where(Forecast.id == forecast_id)
     )
-    forecast = result.scalar_one_or_none()
 
     if forecast is None:
         raise HTTPException(
@@ -98,7 +115,7 @@ async def update_forecast(
             detail="Forecast not found",
         )
 
-    if forecast.user_id != current_user.id:
+    if forecast.user_id != user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You can only update your own forecasts",
@@ -124,30 +141,40 @@ async def update_forecast(
     forecast.probability = update_data.probability
     if update_data.reasoning is not None:
         forecast.reasoning = update_data.reasoning
+    # Flush here so the UPDATE fails in this handler rather than at commit,
+    # and the response carries the new updated_at
+    await db.flush()
 
+    after_commit(db, bump_group_version, prediction.group_id)
     return forecast
 
 
 @router.get("/prediction/{prediction_id}", response_model=list[ForecastResponse])
 async def list_forecasts_for_prediction(
     prediction_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> list[Forecast]:
     """List all forecasts for a prediction."""
-    prediction_result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
+    access_result = await db.execute(
+        select(
+            exists()
+            .where(
+                GroupMembership.group_id == Prediction.group_id,
+                GroupMembership.user_id == user_id,
+            )
+            .label("is_member")
+        ).where(Prediction.id == prediction_id)
     )
-    prediction = prediction_result.scalar_one_or_none()
+    access = access_result.first()
 
-    if prediction is None:
+    if access is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Prediction not found",
         )
 
-    membership = await get_membership(db, prediction.group_id, current_user.id)
-    if membership is None:
+    if not access.is_member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this group",
@@ -163,13 +190,13 @@ async def list_forecasts_for_prediction(
 
 @router.get("/mine", response_model=list[ForecastResponse])
 async def list_my_forecasts(
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> list[Forecast]:
     """List all forecasts by the current user."""
     result = await db.execute(
         select(Forecast)
-        .where(Forecast.user_id == current_user.id)
+        .where(Forecast.user_id == user_id)
         .order_by(Forecast.created_at.desc())
     )
     return list(result.scalars().all())
@@ -1,199 +1,427 @@
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import bindparam, delete, exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.auth import get_current_user
-from app.database import get_db
-from app.models import Group, GroupMembership, GroupRole, User
+from app.auth import get_current_user_id
+from app.cache import TTLCache
+from app.database import after_commit, get_db
+from app.models import Group, GroupMembership, GroupRole, User, generate_invite_code
+from app.ratelimit import RateLimiter, rate_limit
 from app.schemas import (
     GroupCreate,
     GroupMemberResponse,
     GroupResponse,
     GroupWithMembership,
 )
+from app.templating import bump_group_version
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# First page of each user's groups (with role) and its next cursor, as served
+# by list_my_groups. Short-lived so other workers' changes show up quickly.
+# Only ever a listing payload: access checks always go to the database.
+_user_groups: TTLCache[tuple[list[GroupWithMembership], int | None]] = TTLCache(
+    maxsize=10_000, ttl=30
+)
+
+
+INVITE_CODE_ATTEMPTS = 3
+
+# Invite-code guesses per user, shared by the API and the join page
+join_attempts = RateLimiter(limit=5, window=1)
+
+# Statements are built once at import; handlers only supply bound values.
+# Ids start at 1, so after=0 selects the first page.
+
+# Plain column rows: no Group instances or identity-map bookkeeping
+_STMT_LIST_GROUPS = (
+    select(
+        Group.id,
+        Group.name,
+        Group.description,
+        Group.invite_code,
+        Group.created_at,
+        GroupMembership.role,
+    )
+    .join(GroupMembership)
+    .where(
+        GroupMembership.user_id == bindparam("user_id"),
+        Group.id > bindparam("after"),
+    )
+    .order_by(Group.id)
+    .limit(bindparam("limit"))
+)
+
+# Group and whether the caller already belongs to it, in one round trip
+_STMT_GROUP_BY_INVITE = select(
+    Group,
+    exists()
+    .where(
+        GroupMembership.group_id == Group.id,
+        GroupMembership.user_id == bindparam("user_id"),
+    )
+    .label("already_member"),
+).where(Group.invite_code == bindparam("invite_code"))
+
+_STMT_LIST_MEMBERS = (
+    select(
+        User.id,
+        User.email,
+        User.display_name,
+        GroupMembership.role,
+        GroupMembership.joined_at,
+    )
+    .join(User, User.id == GroupMembership.user_id)
+    .where(
+        GroupMembership.group_id == bindparam("group_id"),
+        User.id > bindparam("after"),
+    )
+    .order_by(User.id)
+    .limit(bindparam("limit"))
+)
+
+_STMT_GROUP_FOR_MEMBER = (
+    select(Group, GroupMembership)
+    .join(GroupMembership)
+    .where(
+        Group.id == bindparam("group_id"),
+        GroupMembership.user_id == bindparam("user_id"),
+    )
+)
+
+_STMT_MEMBERSHIP = select(GroupMembership).where(
+    GroupMembership.group_id == bindparam("group_id"),
+    GroupMembership.user_id == bindparam("user_id"),
+)
+
+_STMT_LEAVE_GROUP = (
+    delete(GroupMembership)
+    .where(
+        GroupMembership.group_id == bindparam("group_id"),
+        GroupMembership.user_id == bindparam("user_id"),
+    )
+    .execution_options(synchronize_session=False)
+)
+
+
+def invalidate_user_groups(*user_ids: int) -> None:
+    """
+    Drop cached group listings after a membership change. Call it once the
+    change is committed (see after_commit), or a concurrent read can cache
+    the old listing again.
+    """
+    for user_id in user_ids:
+        _user_groups.delete(user_id)
+
 
 @router.post("", response_model=GroupResponse, status_code=status.HTTP_201_CREATED)
 async def create_group(
     group_data: GroupCreate,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
-) -> Group:
+) -> GroupResponse:
     """Create a new group. The creator becomes an admin."""
-    group = Group(name=group_data.name, description=group_data.description)
-    db.add(group)
-    await db.flush()
+    group_id, invite_code, created_at = await create_group_with_admin(
+        db, group_data.name, group_data.description, user_id
+    )
 
-    membership = GroupMembership(
-        user_id=current_user.id,
-        group_id=group.id,
-        role=GroupRole.admin,
+    return GroupResponse.model_construct(
+        id=group_id,
+        name=group_data.name,
+        description=group_data.description,
+        invite_code=invite_code,
+        created_at=created_at,
     )
-    db.add(membership)
-    return group
 
 
 @router.get("", response_model=list[GroupWithMembership])
 async def list_my_groups(
-    current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
-) -> list[dict]:
-    """List all groups the current user is a member of."""
-    result = await db.execute(
-        select(Group, GroupMembership.role)
-        .join(GroupMembership)
-        .where(GroupMembership.user_id == current_user.id)
-    )
-    rows = result.all()
-
-    return [
-        GroupWithMembership(
-            id=group.id,
-            name=group.name,
-            description=group.description,
-            invite_code=group.invite_code,
-            created_at=group.created_at,
-            role=role,
+    after: int | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+) -> list[GroupWithMembership]:
+    """
+    List the groups the current user is a member of, ordered by group id.
+    Pages with ?after=<last group id>; X-Next-Cursor is set when more remain.
+    """
+    cacheable = after is None and limit == PAGE_SIZE
+    cached = _user_groups.get(user_id) if cacheable else None
+    if cached is not None:
+        groups, next_cursor = cached
+    else:
+        result = await db.execute(
+            _STMT_LIST_GROUPS,
+            {"user_id": user_id, "after": after or 0, "limit": limit + 1},
         )
-        for group, role in rows
-    ]
+        rows = result.all()
+
+        # Trusted DB values, so skip validation
+        groups = [
+            GroupWithMembership.model_construct(
+                id=group_id,
+                name=name,
+                description=description,
+                invite_code=invite_code,
+                created_at=created_at,
+                role=role,
+            )
+            for group_id, name, description, invite_code, created_at, role in rows[:limit]
+        ]
+        next_cursor = groups[-1].id if len(rows) > limit else None
+        if cacheable:
+            _user_groups.set(user_id, (groups, next_cursor))
+
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return groups
 
 
 @router.get("/{group_id}", response_model=GroupResponse)
 async def get_group(
     group_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Group:
     """Get a specific group. User must be a member."""
-    group = await _get_group_for_member(db, group_id, current_user.id)
+    group, _ = await _get_group_for_member(db, group_id, user_id)
     return group
 
 
-@router.post("/join", response_model=GroupResponse)
+@router.post(
+    "/join",
+    response_model=GroupResponse,
+    dependencies=[Depends(rate_limit(join_attempts))],
+)
 async def join_group(
     invite_code: str,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Group:
     """Join a group using an invite code."""
     result = await db.execute(
-        select(Group).where(Group.invite_code == invite_code)
+        _STMT_GROUP_BY_INVITE, {"user_id": user_id, "invite_code": invite_code}
     )
-    group = result.scalar_one_or_none()
+    row = result.first()
 
-    if group is None:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invalid invite code",
         )
 
-    existing = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group.id,
-            GroupMembership.user_id == current_user.id,
-        )
-    )
-    if existing.scalar_one_or_none() is not None:
+    group, already_member = row
+    if already_member:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Already a member of this group",
         )
 
     membership = GroupMembership(
-        user_id=current_user.id,
+        user_id=user_id,
         group_id=group.id,
         role=GroupRole.member,
     )
     db.add(membership)
+    try:
+        # Flush here so a racing join fails in this handler, not at commit
+        await db.flush()
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Already a member of this group",
+        )
+    after_commit(db, invalidate_user_groups, user_id)
+    after_commit(db, bump_group_version, group.id)
     return group
 
 
 @router.get("/{group_id}/members", response_model=list[GroupMemberResponse])
 async def list_group_members(
     group_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
-) -> list[dict]:
-    """List all members of a group."""
-    await _get_group_for_member(db, group_id, current_user.id)
-
+    after: int | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+) -> list[GroupMemberResponse]:
+    """
+    List the members of a group, ordered by user id.
+    Pages with ?after=<last user id>; X-Next-Cursor is set when more remain.
+    """
     result = await db.execute(
-        select(GroupMembership)
-        .options(selectinload(GroupMembership.user))
-        .where(GroupMembership.group_id == group_id)
+        _STMT_LIST_MEMBERS,
+        {"group_id": group_id, "after": after or 0, "limit": limit + 1},
     )
-    memberships = result.scalars().all()
+    rows = result.all()
+
+    # The caller is usually on the page, which proves membership without
+    # another query; a missing group yields no rows and fails the check too
+    if not any(row.id == user_id for row in rows):
+        if await get_membership(db, group_id, user_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Group not found or you are not a member",
+            )
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
 
     return [
-        GroupMemberResponse(
-            user_id=m.user.id,
-            email=m.user.email,
-            display_name=m.user.display_name,
-            role=m.role,
-            joined_at=m.joined_at,
+        GroupMemberResponse.model_construct(
+            user_id=member_id,
+            email=email,
+            display_name=display_name,
+            role=role,
+            joined_at=joined_at,
         )
-        for m in memberships
+        for member_id, email, display_name, role, joined_at in rows
     ]
 
 
 @router.delete("/{group_id}/leave", status_code=status.HTTP_204_NO_CONTENT)
 async def leave_group(
     group_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> None:
     """Leave a group."""
+    # A single DELETE; no matching row means the caller was not a member
     result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == current_user.id,
-        )
+        _STMT_LEAVE_GROUP, {"group_id": group_id, "user_id": user_id}
     )
-    membership = result.scalar_one_or_none()
-
-    if membership is None:
+    if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Not a member of this group",
         )
 
-    await db.delete(membership)
+    after_commit(db, invalidate_user_groups, user_id)
+    after_commit(db, bump_group_version, group_id)
+
+
+async def create_group_with_admin(
+    db: AsyncSession, name: str, description: str | None, user_id: int
+) -> tuple[int, str, datetime]:
+    """
+    Create a group with user_id as its admin, without ORM instances.
+    Returns the group's (id, invite_code, created_at).
+    """
+    # The invite code is generated here so the whole row is known up front;
+    # a unique-index clash on it is astronomically rare but retried anyway
+    for attempt in range(INVITE_CODE_ATTEMPTS):
+        invite_code = generate_invite_code()
+        try:
+            async with db.begin_nested():
+                group_id, created_at = await _insert_group_with_admin(
+                    db, name, description, invite_code, user_id
+                )
+            break
+        except IntegrityError:
+            if attempt == INVITE_CODE_ATTEMPTS - 1:
+                raise
+    after_commit(db, invalidate_user_groups, user_id)
+    return group_id, invite_code, created_at
+
+
+async def _insert_group_with_admin(
+    db: AsyncSession,
+    name: str,
+    description: str | None,
+    invite_code: str,
+    user_id: int,
+) -> tuple[int, datetime]:
+    """
+    Insert a group and its admin membership.
+    Returns the group's (id, created_at).
+    """
+    new_group = (
+        insert(Group)
+        .values(name=name, description=description, invite_code=invite_code)
+        .returning(Group.id, Group.created_at)
+    )
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Both INSERTs in one statement via data-modifying CTEs
+        group_cte = new_group.cte("new_group")
+        membership_cte = (
+            insert(GroupMembership)
+            .from_select(
+                ["user_id", "group_id", "role"],
+                select(
+                    literal(user_id),
+                    group_cte.c.id,
+                    literal(GroupRole.admin, GroupMembership.__table__.c.role.type),
+                ),
+            )
+            .cte("new_membership")
+        )
+        result = await db.execute(
+            select(group_cte.c.id, group_cte.c.created_at).add_cte(membership_cte)
+        )
+        return result.one()
+
+    # SQLite cannot INSERT inside a CTE
+    group_id, created_at = (await db.execute(new_group)).one()
+    await db.execute(
+        insert(GroupMembership).values(
+            user_id=user_id, group_id=group_id, role=GroupRole.admin
+        )
+    )
+    return group_id, created_at
 
 
 async def _get_group_for_member(
     db: AsyncSession, group_id: int, user_id: int
-) -> Group:
-    """Get a group, verifying the user is a member."""
+) -> tuple[Group, GroupMembership]:
+    """Get a group and the user's membership in it, verifying the user is a member."""
     result = await db.execute(
-        select(Group)
-        .join(GroupMembership)
-        .where(Group.id == group_id, GroupMembership.user_id == user_id)
+        _STMT_GROUP_FOR_MEMBER, {"group_id": group_id, "user_id": user_id}
     )
-    group = result.scalar_one_or_none()
+    row = result.first()
 
-    if group is None:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found or you are not a member",
         )
 
-    return group
+    group, membership = row
+    return group, membership
 
 
 async def get_membership(
     db: AsyncSession, group_id: int, user_id: int
 ) -> GroupMembership | None:
     """Get membership for a user in a group."""
-    result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user_id,
-        )
+    return await db.scalar(
+        _STMT_MEMBERSHIP, {"group_id": group_id, "user_id": user_id}
     )
-    return result.scalar_one_or_none()
+
+
+async def require_membership(
+    group_id: int,
+    user_id: Annotated[int, Depends(get_current_user_id)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> GroupMembership:
+    """
+    Dependency: the caller's membership in the path's group, or 404.
+    FastAPI resolves it once per request, however many dependents share it.
+    """
+    membership = await get_membership(db, group_id, user_id)
+    if membership is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found or you are not a member",
+        )
+    return membership
@@ -1,25 +1,28 @@
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, NoReturn
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy import select
+from sqlalchemy import bindparam, delete, exists, func, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager, raiseload, selectinload
 
 from app.auth import (
+    CachedUser,
     create_access_token,
     create_group_invite_token,
     create_magic_link_token,
+    get_cached_user,
     send_group_invite_email,
+    send_in_background,
     send_magic_link_email,
     verify_access_token,
     verify_group_invite_token,
     verify_magic_link_token,
 )
 from app.config import get_settings
-from app.database import get_db
+from app.database import dialect_insert, get_db
 from app.models import (
     Forecast,
     Group,
@@ -29,20 +32,67 @@ from app.models import (
     PredictionStatus,
     User,
 )
-from app.scoring import calculate_brier_score, calculate_calibration_buckets
+from app.routers.groups import (
+    create_group_with_admin,
+    invalidate_user_groups,
+    join_attempts,
+)
+from app.routers.predictions import can_manage_prediction
+from app.routers.stats import (
+    cached_leaderboard,
+    calculate_forecast_stats,
+    calculate_user_calibration,
+)
+from app.scoring import store_brier_scores
+from app.templating import (
+    bump_group_version,
+    cache_partial,
+    cached_partial,
+    content_version,
+    group_version,
+    templates,
+)
 
 router = APIRouter(tags=["pages"])
-templates = Jinja2Templates(directory="templates")
 settings = get_settings()
 
 # Cookie name for storing JWT
 AUTH_COOKIE = "access_token"
 
+# Statements for the hot lookups are built once at import; handlers only
+# supply bound values.
+_STMT_GROUPS_FOR_USER = (
+    select(Group).join(GroupMembership).where(GroupMembership.user_id == bindparam("user_id"))
+)
+
+_STMT_MEMBER_ROLE = select(GroupMembership.role).where(
+    GroupMembership.group_id == bindparam("group_id"),
+    GroupMembership.user_id == bindparam("user_id"),
+)
+
+# Member rows for the members list: one join, only the columns it shows
+_STMT_GROUP_MEMBERS = (
+    select(GroupMembership.user_id, GroupMembership.role, User.email, User.display_name)
+    .join(User, User.id == GroupMembership.user_id)
+    .where(GroupMembership.group_id == bindparam("group_id"))
+)
+
+_STMT_PREDICTION_DETAIL = (
+    select(Prediction)
+    .options(
+        selectinload(Prediction.group),
+        selectinload(Prediction.creator),
+        selectinload(Prediction.forecasts).selectinload(Forecast.user),
+        raiseload("*", sql_only=True),
+    )
+    .where(Prediction.id == bindparam("prediction_id"))
+)
+
 
 async def get_current_user_optional(
     request: Request,
     db: AsyncSession,
-) -> User | None:
+) -> CachedUser | None:
     """Get user from cookie, return None if not authenticated."""
     token = request.cookies.get(AUTH_COOKIE)
     if not token:
@@ -52,14 +102,13 @@ async def get_current_user_optional(
     if user_id is None:
         return None
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    return result.scalar_one_or_none()
+    return await get_cached_user(db, user_id)
 
 
 async def require_user(
     request: Request,
     db: Annotated[AsyncSession, Depends(get_db)],
-) -> User:
+) -> CachedUser:
     """Require authenticated user, redirect to login if not."""
     user = await get_current_user_optional(request, db)
     if user is None:
@@ -67,6 +116,30 @@ async def require_user(
     return user
 
 
+async def _member_role(db: AsyncSession, group_id: int, user_id: int) -> GroupRole | None:
+    """The user's role in a group, or None if not a member. Fetches the role column only."""
+    return await db.scalar(_STMT_MEMBER_ROLE, {"group_id": group_id, "user_id": user_id})
+
+
+async def _raise_manage_error(
+    db: AsyncSession, prediction_id: int, user_id: int, detail: str | None = None
+) -> NoReturn:
+    """Explain why a guarded resolve/delete matched no rows. Only runs on failure."""
+    row = (
+        await db.execute(
+            select(Prediction.status, can_manage_prediction(user_id)).where(
+                Prediction.id == prediction_id
+            )
+        )
+    ).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404)
+    if not row[1]:
+        raise HTTPException(status_code=403, detail=detail)
+    # Permission was granted, so this was a delete of an open prediction
+    raise HTTPException(status_code=400, detail="Cannot delete open predictions")
+
+
 # ============ Auth Pages ============
 
 
@@ -95,7 +168,7 @@ async def login_submit(
     token = create_magic_link_token(email)
     magic_link = f"{settings.base_url}/auth/callback?token={token}"
 
-    await send_magic_link_email(email, magic_link)
+    send_in_background(send_magic_link_email(email, magic_link))
 
     return templates.TemplateResponse(
         "check_email.html",
@@ -121,7 +194,6 @@ async def auth_callback(
         user = User(email=email)
         db.add(user)
         await db.commit()
-        await db.refresh(user)
 
     # Create access token and set cookie
     access_token = create_access_token(user.id)
@@ -147,34 +219,47 @@ async def logout():
 # ============ Feed ============
 
 
+async def _feed_partial_key(
+    db: AsyncSession, user_id: int, group_id: int | None, status: str | None
+) -> tuple | None:
+    """
+    Cache key for the feed list partial. A single group's list is the same for
+    every member, so it is shared once membership is confirmed; the all-groups
+    list is per user. None means don't cache (non-members get an empty list).
+    """
+    if not group_id:
+        return ("feed", "user", user_id, status, content_version())
+    if await _member_role(db, group_id, user_id) is None:
+        return None
+    return ("feed", "group", group_id, status, group_version(group_id))
+
+
 @router.get("/feed", response_class=HTMLResponse)
 async def feed_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     group_id: int | None = None,
     status: str | None = None,
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
-    # Get user's groups
-    groups_result = await db.execute(
-        select(Group)
-        .join(GroupMembership)
-        .where(GroupMembership.user_id == user.id)
-    )
-    groups = list(groups_result.scalars().all())
-
-    # Get predictions
+    # HTMX filter changes and polling are served from rendered bytes when possible
+    is_htmx = bool(request.headers.get("HX-Request"))
+    partial_key = await _feed_partial_key(db, user.id, group_id, status) if is_htmx else None
+    if partial_key is not None:
+        body = cached_partial(partial_key)
+        if body is not None:
+            return HTMLResponse(body)
+
+    # Get predictions; Group is joined anyway, so fill Prediction.group from it
     query = (
         select(Prediction)
+        .join(Group)
         .options(
-            selectinload(Prediction.group),
+            contains_eager(Prediction.group),
             selectinload(Prediction.creator),
             selectinload(Prediction.forecasts),
+            raiseload("*", sql_only=True),
         )
-        .join(Group)
         .join(GroupMembership)
         .where(GroupMembership.user_id == user.id)
     )
@@ -192,11 +277,24 @@ async def feed_page(
     predictions = list(result.scalars().all())
 
     # If HTMX request, return just the list
-    if request.headers.get("HX-Request"):
-        return templates.TemplateResponse(
+    if is_htmx:
+        response = templates.TemplateResponse(
             "partials/prediction_list.html",
-            {"request": request, "predictions": predictions, "user": user},
+            {
+                "request": request,
+                "predictions": predictions,
+                "user": user,
+                "selected_group_id": group_id,
+                "status_filter": status,
+            },
         )
+        if partial_key is not None:
+            cache_partial(partial_key, response.body)
+        return response
+
+    # Groups for the filter; only the full page renders them
+    groups_result = await db.execute(_STMT_GROUPS_FOR_USER, {"user_id": user.id})
+    groups = list(groups_result.scalars().all())
 
     return templates.TemplateResponse(
         "feed.html",
@@ -218,18 +316,11 @@ async def feed_page(
 @router.get("/predictions/new", response_class=HTMLResponse)
 async def new_prediction_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get user's groups
-    groups_result = await db.execute(
-        select(Group)
-        .join(GroupMembership)
-        .where(GroupMembership.user_id == user.id)
-    )
+    groups_result = await db.execute(_STMT_GROUPS_FOR_USER, {"user_id": user.id})
     groups = list(groups_result.scalars().all())
 
     if not groups:
@@ -243,7 +334,7 @@ async def new_prediction_page(
 
 @router.post("/predictions/new")
 async def create_prediction_submit(
-    request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     group_id: Annotated[int, Form()],
     title: Annotated[str, Form()],
@@ -253,10 +344,6 @@ async def create_prediction_submit(
     probability: Annotated[int, Form()] = 50,
     reasoning: Annotated[str | None, Form()] = None,
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Parse date (required)
     try:
         parsed_date = datetime.strptime(resolution_date, "%Y-%m-%d")
@@ -284,6 +371,7 @@ async def create_prediction_submit(
     )
     db.add(forecast)
     await db.commit()
+    bump_group_version(group_id)
 
     return RedirectResponse(f"/predictions/{prediction.id}", status_code=303)
 
@@ -292,36 +380,19 @@ async def create_prediction_submit(
 async def prediction_page(
     request: Request,
     prediction_id: int,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get prediction with relationships
-    result = await db.execute(
-        select(Prediction)
-        .options(
-            selectinload(Prediction.group),
-            selectinload(Prediction.creator),
-            selectinload(Prediction.forecasts).selectinload(Forecast.user),
-        )
-        .where(Prediction.id == prediction_id)
-    )
+    result = await db.execute(_STMT_PREDICTION_DETAIL, {"prediction_id": prediction_id})
     prediction = result.scalar_one_or_none()
 
     if not prediction:
         raise HTTPException(status_code=404, detail="Prediction not found")
 
     # Check membership
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == prediction.group_id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    membership = membership_result.scalar_one_or_none()
-    if not membership:
+    role = await _member_role(db, prediction.group_id, user.id)
+    if role is None:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
     # Get user's forecast if exists
@@ -329,19 +400,16 @@ async def prediction_page(
         (f for f in prediction.forecasts if f.user_id == user.id), None
     )
 
-    # Calculate Brier scores if resolved (only for locked-in forecasts)
-    brier_scores = {}
-    if prediction.status != PredictionStatus.open:
-        for forecast in prediction.forecasts:
-            # Only show scores for forecasts that were locked in
-            if forecast.created_at < prediction.lock_in_at:
-                score = calculate_brier_score(forecast.probability, prediction.status)
-                if score is not None:
-                    brier_scores[forecast.id] = score
+    # Brier scores are stored at resolution, for locked-in forecasts only
+    brier_scores = {
+        forecast.id: forecast.brier_score
+        for forecast in prediction.forecasts
+        if forecast.brier_score is not None
+    }
 
     # Check if user can resolve
     can_resolve = (
-        prediction.creator_id == user.id or membership.role == GroupRole.admin
+        prediction.creator_id == user.id or role == GroupRole.admin
     )
 
     return templates.TemplateResponse(
@@ -370,42 +438,39 @@ async def submit_forecast(
     if not user:
         raise HTTPException(status_code=401)
 
-    # Get prediction
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.forecasts).selectinload(Forecast.user))
-        .where(Prediction.id == prediction_id)
-    )
-    prediction = result.scalar_one_or_none()
+    prediction = await db.scalar(select(Prediction).where(Prediction.id == prediction_id))
     if not prediction or prediction.status != PredictionStatus.open:
         raise HTTPException(status_code=400)
 
     if prediction.is_locked:
         raise HTTPException(status_code=400, detail="Forecasts are locked")
 
-    # Check for existing forecast
-    existing = next(
-        (f for f in prediction.forecasts if f.user_id == user.id), None
+    # Insert or update the user's forecast in one statement, keyed on
+    # uq_forecast_pred_user; created_at is kept on update so lock-in still holds
+    stmt = dialect_insert(db, Forecast).values(
+        prediction_id=prediction_id,
+        user_id=user.id,
+        probability=probability / 100,
+        reasoning=reasoning or None,
     )
-
-    if existing:
-        existing.probability = probability / 100
-        existing.reasoning = reasoning or None
-    else:
-        forecast = Forecast(
-            prediction_id=prediction_id,
-            user_id=user.id,
-            probability=probability / 100,
-            reasoning=reasoning or None,
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[Forecast.prediction_id, Forecast.user_id],
+            set_={
+                "probability": stmt.excluded.probability,
+                "reasoning": stmt.excluded.reasoning,
+                "updated_at": func.now(),
+            },
         )
-        db.add(forecast)
-
+    )
     await db.commit()
+    bump_group_version(prediction.group_id)
 
-    # Re-fetch forecasts
+    # The only forecast read: forecasts and their users in one joined SELECT
     result = await db.execute(
         select(Forecast)
-        .options(selectinload(Forecast.user))
+        .join(Forecast.user)
+        .options(contains_eager(Forecast.user))
         .where(Forecast.prediction_id == prediction_id)
     )
     forecasts = list(result.scalars().all())
@@ -418,96 +483,55 @@ async def submit_forecast(
 
 @router.post("/predictions/{prediction_id}/resolve")
 async def resolve_prediction_page(
-    request: Request,
     prediction_id: int,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     outcome: Annotated[str, Form()],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
-    result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
-    )
-    prediction = result.scalar_one_or_none()
-    if not prediction:
-        raise HTTPException(status_code=404)
-
-    # Check permission
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == prediction.group_id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    membership = membership_result.scalar_one_or_none()
-    if not membership:
-        raise HTTPException(status_code=403)
-
-    can_resolve = (
-        prediction.creator_id == user.id or membership.role == GroupRole.admin
-    )
-    if not can_resolve:
-        raise HTTPException(status_code=403)
-
-    # Resolve
-    prediction.status = PredictionStatus(outcome)
-    prediction.resolved_at = datetime.utcnow()
+    # Permission check and update in one statement; no Prediction is loaded
+    group_id = await db.scalar(
+        update(Prediction)
+        .where(Prediction.id == prediction_id, can_manage_prediction(user.id))
+        .values(status=PredictionStatus(outcome), resolved_at=func.now())
+        .returning(Prediction.group_id)
+        .execution_options(synchronize_session=False)
+    )
+    if group_id is None:
+        await _raise_manage_error(db, prediction_id, user.id)
+    await db.execute(store_brier_scores(prediction_id))
     await db.commit()
+    bump_group_version(group_id)
 
     return RedirectResponse(f"/predictions/{prediction_id}", status_code=303)
 
 
 @router.post("/predictions/{prediction_id}/delete")
 async def delete_prediction(
-    request: Request,
     prediction_id: int,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
     """Delete a resolved prediction (admin only)."""
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
-    result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
-    )
-    prediction = result.scalar_one_or_none()
-    if not prediction:
-        raise HTTPException(status_code=404)
-
-    # Check permission (must be admin or creator)
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == prediction.group_id,
-            GroupMembership.user_id == user.id,
+    # Core DELETE with the checks in its WHERE clause; no Prediction is loaded
+    group_id = await db.scalar(
+        delete(Prediction)
+        .where(
+            Prediction.id == prediction_id,
+            Prediction.status != PredictionStatus.open,
+            can_manage_prediction(user.id),
         )
+        .returning(Prediction.group_id)
+        .execution_options(synchronize_session=False)
     )
-    membership = membership_result.scalar_one_or_none()
-    if not membership:
-        raise HTTPException(status_code=403)
-
-    can_delete = (
-        prediction.creator_id == user.id or membership.role == GroupRole.admin
-    )
-    if not can_delete:
-        raise HTTPException(status_code=403, detail="Only admins or creator can delete")
-
-    # Only allow deleting resolved predictions
-    if prediction.status == PredictionStatus.open:
-        raise HTTPException(status_code=400, detail="Cannot delete open predictions")
+    if group_id is None:
+        await _raise_manage_error(
+            db, prediction_id, user.id, detail="Only admins or creator can delete"
+        )
 
-    # Delete associated forecasts first
-    await db.execute(
-        select(Forecast).where(Forecast.prediction_id == prediction_id)
-    )
-    from sqlalchemy import delete
+    # Delete associated forecasts too (SQLite does not enforce the FK cascade)
     await db.execute(delete(Forecast).where(Forecast.prediction_id == prediction_id))
-
-    # Delete the prediction
-    await db.delete(prediction)
     await db.commit()
+    bump_group_version(group_id)
 
     return RedirectResponse("/feed", status_code=303)
 
@@ -518,19 +542,12 @@ async def delete_prediction(
 @router.get("/leaderboard", response_class=HTMLResponse)
 async def leaderboard_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     group_id: int | None = None,
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get user's groups
-    groups_result = await db.execute(
-        select(Group)
-        .join(GroupMembership)
-        .where(GroupMembership.user_id == user.id)
-    )
+    groups_result = await db.execute(_STMT_GROUPS_FOR_USER, {"user_id": user.id})
     groups = list(groups_result.scalars().all())
 
     if not groups:
@@ -543,13 +560,18 @@ async def leaderboard_page(
     selected_group_id = group_id or groups[0].id
 
     # Get leaderboard data
-    leaderboard = await _calculate_leaderboard(db, selected_group_id)
+    leaderboard, _ = await cached_leaderboard(db, selected_group_id)
 
     # If HTMX request, return just the content
     if request.headers.get("HX-Request"):
         return templates.TemplateResponse(
             "partials/leaderboard_content.html",
-            {"request": request, "user": user, "leaderboard": leaderboard},
+            {
+                "request": request,
+                "user": user,
+                "leaderboard": leaderboard,
+                "selected_group_id": selected_group_id,
+            },
         )
 
     return templates.TemplateResponse(
@@ -565,130 +587,30 @@ async def leaderboard_page(
     )
 
 
-async def _calculate_leaderboard(db: AsyncSession, group_id: int) -> list[dict]:
-    """Calculate leaderboard for a group."""
-    # Get members
-    members_result = await db.execute(
-        select(GroupMembership)
-        .options(selectinload(GroupMembership.user))
-        .where(GroupMembership.group_id == group_id)
-    )
-    members = list(members_result.scalars().all())
-
-    # Get resolved prediction IDs
-    pred_result = await db.execute(
-        select(Prediction.id).where(
-            Prediction.group_id == group_id,
-            Prediction.status != PredictionStatus.open,
-        )
-    )
-    resolved_ids = set(pred_result.scalars().all())
-
-    if not resolved_ids:
-        return []
-
-    leaderboard = []
-    for member in members:
-        # Get forecasts
-        forecast_result = await db.execute(
-            select(Forecast)
-            .options(selectinload(Forecast.prediction))
-            .where(
-                Forecast.user_id == member.user_id,
-                Forecast.prediction_id.in_(resolved_ids),
-            )
-        )
-        forecasts = list(forecast_result.scalars().all())
-
-        # Only count forecasts that were locked in (created before lock-in deadline)
-        locked_forecasts = [
-            f for f in forecasts
-            if f.created_at < f.prediction.lock_in_at
-        ]
-
-        if not locked_forecasts:
-            continue
-
-        # Calculate average
-        scores = []
-        for f in locked_forecasts:
-            score = calculate_brier_score(f.probability, f.prediction.status)
-            if score is not None:
-                scores.append(score)
-
-        if scores:
-            avg = sum(scores) / len(scores)
-            leaderboard.append({
-                "user_id": member.user.id,
-                "email": member.user.email,
-                "display_name": member.user.display_name,
-                "average_brier_score": avg,
-                "forecast_count": len(locked_forecasts),
-            })
-
-    # Sort by score (lower is better)
-    leaderboard.sort(key=lambda x: x["average_brier_score"])
-
-    # Add ranks
-    for i, entry in enumerate(leaderboard):
-        entry["rank"] = i + 1
-
-    return leaderboard
-
-
 # ============ Profile ============
 
 
 @router.get("/profile", response_class=HTMLResponse)
 async def profile_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get user's groups with membership info
     groups_result = await db.execute(
         select(GroupMembership)
-        .options(selectinload(GroupMembership.group))
+        .options(selectinload(GroupMembership.group), raiseload("*", sql_only=True))
         .where(GroupMembership.user_id == user.id)
     )
     groups = list(groups_result.scalars().all())
 
-    # Get user's forecasts for stats
-    forecasts_result = await db.execute(
-        select(Forecast)
-        .options(selectinload(Forecast.prediction))
-        .where(Forecast.user_id == user.id)
-    )
-    forecasts = list(forecasts_result.scalars().all())
-
-    # Calculate stats - only count forecasts that were locked in
-    resolved = [
-        f for f in forecasts
-        if f.prediction.status != PredictionStatus.open
-        and f.created_at < f.prediction.lock_in_at
-    ]
-    scores = []
-    for f in resolved:
-        score = calculate_brier_score(f.probability, f.prediction.status)
-        if score is not None:
-            scores.append(score)
-
-    stats = {
-        "total_forecasts": len(forecasts),
-        "resolved_forecasts": len(resolved),
-        "average_brier_score": sum(scores) / len(scores) if scores else None,
-    }
+    # Stats in one aggregate - only forecasts that were locked in are scored
+    stats = await calculate_forecast_stats(db, user.id)
 
-    # Calculate calibration - only count locked-in forecasts
-    calibration_data = [
-        (f.probability, f.prediction.status)
-        for f in resolved
-        if f.prediction.status != PredictionStatus.ambiguous
-    ]
-    calibration = calculate_calibration_buckets(calibration_data) if calibration_data else []
+    # Calibration needs scored forecasts; skip its query when there are none
+    calibration = (
+        await calculate_user_calibration(db, user.id) if stats["resolved_forecasts"] else []
+    )
 
     return templates.TemplateResponse(
         "profile.html",
@@ -709,12 +631,9 @@ async def profile_page(
 @router.get("/groups", response_class=HTMLResponse)
 async def groups_list_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get user's groups with membership info
     groups_result = await db.execute(
         select(GroupMembership)
@@ -737,12 +656,9 @@ async def groups_list_page(
 @router.get("/groups/new", response_class=HTMLResponse)
 async def new_group_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     return templates.TemplateResponse(
         "create_group.html",
         {"request": request, "user": user},
@@ -751,25 +667,12 @@ async def new_group_page(
 
 @router.post("/groups/new")
 async def create_group_submit(
-    request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     name: Annotated[str, Form()],
     description: Annotated[str | None, Form()] = None,
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
-    group = Group(name=name, description=description or None)
-    db.add(group)
-    await db.flush()
-
-    membership = GroupMembership(
-        user_id=user.id,
-        group_id=group.id,
-        role=GroupRole.admin,
-    )
-    db.add(membership)
+    await create_group_with_admin(db, name, description or None, user.id)
     await db.commit()
 
     return RedirectResponse("/feed", status_code=303)
@@ -778,12 +681,9 @@ async def create_group_submit(
 @router.get("/groups/join", response_class=HTMLResponse)
 async def join_group_page(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     return templates.TemplateResponse(
         "join_group.html",
         {"request": request, "user": user},
@@ -793,43 +693,56 @@ async def join_group_page(
 @router.post("/groups/join")
 async def join_group_submit(
     request: Request,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
     invite_code: Annotated[str, Form()],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
+    if not join_attempts.hit(user.id):
+        return templates.TemplateResponse(
+            "join_group.html",
+            {"request": request, "user": user, "error": "Too many attempts, try again shortly"},
+            status_code=429,
+        )
 
-    # Find group
+    # Find group by its unique invite code; only the id is needed
     result = await db.execute(
-        select(Group).where(Group.invite_code == invite_code.strip())
+        select(
+            Group.id,
+            exists()
+            .where(
+                GroupMembership.group_id == Group.id,
+                GroupMembership.user_id == user.id,
+            )
+            .label("already_member"),
+        ).where(Group.invite_code == invite_code.strip())
     )
-    group = result.scalar_one_or_none()
+    row = result.first()
 
-    if not group:
+    if row is None:
         return templates.TemplateResponse(
             "join_group.html",
             {"request": request, "user": user, "error": "Invalid invite code"},
         )
 
-    # Check if already member
-    existing = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group.id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    if existing.scalar_one_or_none():
+    group_id, already_member = row
+    if already_member:
         return RedirectResponse("/feed", status_code=303)
 
     # Join
     membership = GroupMembership(
         user_id=user.id,
-        group_id=group.id,
+        group_id=group_id,
         role=GroupRole.member,
     )
     db.add(membership)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent join got there first; the user is a member either way
+        await db.rollback()
+        return RedirectResponse("/feed", status_code=303)
+    invalidate_user_groups(user.id)
+    bump_group_version(group_id)
 
     return RedirectResponse("/feed", status_code=303)
 
@@ -838,12 +751,9 @@ async def join_group_submit(
 async def group_detail_page(
     request: Request,
     group_id: int,
+    user: Annotated[CachedUser, Depends(require_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    user = await get_current_user_optional(request, db)
-    if not user:
-        return RedirectResponse("/login", status_code=303)
-
     # Get group
     result = await db.execute(select(Group).where(Group.id == group_id))
     group = result.scalar_one_or_none()
@@ -851,43 +761,39 @@ async def group_detail_page(
         raise HTTPException(status_code=404, detail="Group not found")
 
     # Check membership and get role
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    membership = membership_result.scalar_one_or_none()
-    if not membership:
+    role = await _member_role(db, group_id, user.id)
+    if role is None:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    is_admin = membership.role == GroupRole.admin
+    is_admin = role == GroupRole.admin
 
     # Get all members
-    members_result = await db.execute(
-        select(GroupMembership)
-        .options(selectinload(GroupMembership.user))
-        .where(GroupMembership.group_id == group_id)
-    )
-    members = list(members_result.scalars().all())
+    members_result = await db.execute(_STMT_GROUP_MEMBERS, {"group_id": group_id})
+    members = members_result.all()
 
-    # Get active predictions (open status) with forecasts
+    # Get active predictions (open status) with their forecast counts; only
+    # the listed columns, not whole predictions and forecasts
     predictions_result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.forecasts))
+        select(
+            Prediction.id,
+            Prediction.title,
+            Prediction.resolution_date,
+            func.count(Forecast.id).label("forecast_count"),
+        )
+        .outerjoin(Forecast, Forecast.prediction_id == Prediction.id)
         .where(
             Prediction.group_id == group_id,
             Prediction.status == PredictionStatus.open,
         )
+        .group_by(Prediction.id)
         .order_by(Prediction.created_at.desc())
     )
-    predictions = list(predictions_result.scalars().all())
+    predictions = predictions_result.all()
 
     # Get total prediction count (including resolved)
-    all_pred_result = await db.execute(
-        select(Prediction).where(Prediction.group_id == group_id)
+    prediction_count = await db.scalar(
+        select(func.count(Prediction.id)).where(Prediction.group_id == group_id)
     )
-    prediction_count = len(list(all_pred_result.scalars().all()))
 
     return templates.TemplateResponse(
         "group_detail.html",
@@ -921,14 +827,7 @@ async def send_group_invite(
         raise HTTPException(status_code=404)
 
     # Check admin
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    membership = membership_result.scalar_one_or_none()
-    if not membership or membership.role != GroupRole.admin:
+    if await _member_role(db, group_id, user.id) != GroupRole.admin:
         return templates.TemplateResponse(
             "partials/invite_result.html",
             {"request": request, "success": False, "message": "Only admins can invite members"},
@@ -942,7 +841,9 @@ async def send_group_invite(
     inviter_name = user.display_name or user.email
 
     # Send email
-    await send_group_invite_email(email, inviter_name, group.name, invite_link)
+    send_in_background(
+        send_group_invite_email(email, inviter_name, group.name, invite_link)
+    )
 
     return templates.TemplateResponse(
         "partials/invite_result.html",
@@ -976,29 +877,38 @@ async def accept_group_invite(
         user = User(email=email)
         db.add(user)
         await db.commit()
-        await db.refresh(user)
+    # Kept as a plain int: a rollback below would expire the instance
+    user_id = user.id
 
     # Check if already a member
-    membership_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user.id,
+    already_member = await db.scalar(
+        select(
+            exists().where(
+                GroupMembership.group_id == group_id,
+                GroupMembership.user_id == user_id,
+            )
         )
     )
-    existing_membership = membership_result.scalar_one_or_none()
 
-    if not existing_membership:
+    if not already_member:
         # Add to group
         membership = GroupMembership(
-            user_id=user.id,
+            user_id=user_id,
             group_id=group_id,
             role=GroupRole.member,
         )
         db.add(membership)
-        await db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent accept got there first; the user is a member either way
+            await db.rollback()
+        else:
+            invalidate_user_groups(user_id)
+            bump_group_version(group_id)
 
     # Create access token and set cookie
-    access_token = create_access_token(user.id)
+    access_token = create_access_token(user_id)
     response = RedirectResponse(f"/groups/{group_id}", status_code=303)
     response.set_cookie(
         AUTH_COOKIE,
@@ -1024,43 +934,32 @@ async def remove_group_member(
         raise HTTPException(status_code=401)
 
     # Check admin permission
-    admin_result = await db.execute(
-        select(GroupMembership).where(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user.id,
-        )
-    )
-    admin_membership = admin_result.scalar_one_or_none()
-    if not admin_membership or admin_membership.role != GroupRole.admin:
+    if await _member_role(db, group_id, user.id) != GroupRole.admin:
         raise HTTPException(status_code=403, detail="Only admins can remove members")
 
     # Can't remove yourself
     if member_id == user.id:
         raise HTTPException(status_code=400, detail="Cannot remove yourself")
 
-    # Find and delete the membership
-    member_result = await db.execute(
-        select(GroupMembership).where(
+    # Delete the membership in one statement; nothing to do if already gone
+    removed = await db.execute(
+        delete(GroupMembership).where(
             GroupMembership.group_id == group_id,
             GroupMembership.user_id == member_id,
         )
     )
-    membership = member_result.scalar_one_or_none()
-    if membership:
-        await db.delete(membership)
+    if removed.rowcount:
         await db.commit()
+        invalidate_user_groups(member_id)
+        bump_group_version(group_id)
 
     # Get group for template
     group_result = await db.execute(select(Group).where(Group.id == group_id))
     group = group_result.scalar_one_or_none()
 
     # Get updated members list
-    members_result = await db.execute(
-        select(GroupMembership)
-        .options(selectinload(GroupMembership.user))
-        .where(GroupMembership.group_id == group_id)
-    )
-    members = list(members_result.scalars().all())
+    members_result = await db.execute(_STMT_GROUP_MEMBERS, {"group_id": group_id})
+    members = members_result.all()
 
     return templates.TemplateResponse(
         "partials/members_list.html",
@@ -1,13 +1,13 @@
-from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, NoReturn
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, and_, exists, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.interfaces import ORMOption
 
-from app.auth import get_current_user
-from app.database import get_db
+from app.auth import get_current_user, get_current_user_id
+from app.database import after_commit, get_db
 from app.models import GroupMembership, GroupRole, Prediction, PredictionStatus, User
 from app.routers.groups import get_membership
 from app.schemas import (
@@ -16,10 +16,59 @@ from app.schemas import (
     PredictionWithForecasts,
     ResolveRequest,
 )
+from app.scoring import store_brier_scores
+from app.templating import bump_group_version
 
 router = APIRouter(prefix="/predictions", tags=["predictions"])
 
 
+async def _get_prediction_with_membership(
+    db: AsyncSession, prediction_id: int, user_id: int, *options: ORMOption
+) -> tuple[Prediction, GroupMembership | None]:
+    """
+    Get a prediction and the user's membership in its group in one query.
+    The membership is None if the user is not a member of the group.
+    """
+    row = (
+        await db.execute(
+            select(Prediction, GroupMembership)
+            .outerjoin(
+                GroupMembership,
+                and_(
+                    GroupMembership.group_id == Prediction.group_id,
+                    GroupMembership.user_id == user_id,
+                ),
+            )
+            .options(*options)
+            .where(Prediction.id == prediction_id)
+        )
+    ).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Prediction not found",
+        )
+
+    prediction, membership = row
+    return prediction, membership
+
+
+def can_manage_prediction(user_id: int) -> ColumnElement[bool]:
+    """Whether the user is in the prediction's group as its creator or an admin."""
+    return exists().where(
+        GroupMembership.group_id == Prediction.group_id,
+        GroupMembership.user_id == user_id,
+        or_(Prediction.creator_id == user_id, GroupMembership.role == GroupRole.admin),
+    )
+
+
+def _not_a_member() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="You are not a member of this group",
+    )
+
+
 @router.post("", response_model=PredictionResponse, status_code=status.HTTP_201_CREATED)
 async def create_prediction(
     prediction_data: PredictionCreate,
@@ -29,10 +78,7 @@ async def create_prediction(
     """Create a new prediction in a group."""
     membership = await get_membership(db, prediction_data.group_id, current_user.id)
     if membership is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this group",
-        )
+        raise _not_a_member()
 
     prediction = Prediction(
         group_id=prediction_data.group_id,
@@ -44,23 +90,20 @@ async def create_prediction(
     )
     db.add(prediction)
     await db.flush()
+    after_commit(db, bump_group_version, prediction.group_id)
     return prediction
 
 
 @router.get("/group/{group_id}", response_model=list[PredictionResponse])
 async def list_group_predictions(
     group_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
     status_filter: PredictionStatus | None = None,
 ) -> list[Prediction]:
     """List all predictions in a group."""
-    membership = await get_membership(db, group_id, current_user.id)
-    if membership is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this group",
-        )
+    if await get_membership(db, group_id, user_id) is None:
+        raise _not_a_member()
 
     query = select(Prediction).where(Prediction.group_id == group_id)
     if status_filter:
@@ -74,29 +117,15 @@ async def list_group_predictions(
 @router.get("/{prediction_id}", response_model=PredictionWithForecasts)
 async def get_prediction(
     prediction_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Prediction:
     """Get a prediction with all its forecasts."""
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.forecasts))
-        .where(Prediction.id == prediction_id)
+    prediction, membership = await _get_prediction_with_membership(
+        db, prediction_id, user_id, selectinload(Prediction.forecasts)
     )
-    prediction = result.scalar_one_or_none()
-
-    if prediction is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Prediction not found",
-        )
-
-    membership = await get_membership(db, prediction.group_id, current_user.id)
     if membership is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this group",
-        )
+        raise _not_a_member()
 
     return prediction
 
@@ -105,7 +134,7 @@ async def get_prediction(
 async def resolve_prediction(
     prediction_id: int,
     resolve_data: ResolveRequest,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> Prediction:
     """
@@ -118,16 +147,29 @@ async def resolve_prediction(
             detail="Cannot resolve to 'open' status",
         )
 
-    result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
+    # Status and permission checks live in the WHERE clause, so two racing
+    # resolves cannot both succeed
+    prediction = await db.scalar(
+        update(Prediction)
+        .where(
+            Prediction.id == prediction_id,
+            Prediction.status == PredictionStatus.open,
+            can_manage_prediction(user_id),
+        )
+        .values(status=resolve_data.outcome, resolved_at=func.now())
+        .returning(Prediction)
     )
-    prediction = result.scalar_one_or_none()
-
     if prediction is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Prediction not found",
-        )
+        await _raise_resolve_error(db, prediction_id, user_id)
+
+    await db.execute(store_brier_scores(prediction_id))
+    after_commit(db, bump_group_version, prediction.group_id)
+    return prediction
+
+
+async def _raise_resolve_error(db: AsyncSession, prediction_id: int, user_id: int) -> NoReturn:
+    """Explain why a guarded resolve matched no rows. Only runs on failure."""
+    prediction, membership = await _get_prediction_with_membership(db, prediction_id, user_id)
 
     if prediction.status != PredictionStatus.open:
         raise HTTPException(
@@ -135,58 +177,30 @@ async def resolve_prediction(
             detail="Prediction is already resolved",
         )
 
-    membership = await get_membership(db, prediction.group_id, current_user.id)
     if membership is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this group",
-        )
+        raise _not_a_member()
 
-    can_resolve = (
-        prediction.creator_id == current_user.id or membership.role == GroupRole.admin
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Only the creator or group admin can resolve this prediction",
     )
-    if not can_resolve:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only the creator or group admin can resolve this prediction",
-        )
-
-    prediction.status = resolve_data.outcome
-    prediction.resolved_at = datetime.now(timezone.utc)
-    return prediction
 
 
 @router.delete("/{prediction_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_prediction(
     prediction_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[int, Depends(get_current_user_id)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> None:
     """
     Delete a prediction.
     Only the creator or a group admin can delete.
     """
-    result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
-    )
-    prediction = result.scalar_one_or_none()
-
-    if prediction is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Prediction not found",
-        )
-
-    membership = await get_membership(db, prediction.group_id, current_user.id)
+    prediction, membership = await _get_prediction_with_membership(db, prediction_id, user_id)
     if membership is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this group",
-        )
+        raise _not_a_member()
 
-    can_delete = (
-        prediction.creator_id == current_user.id or membership.role == GroupRole.admin
-    )
+    can_delete = prediction.creator_id == user_id or membership.role == GroupRole.admin
     if not can_delete:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -194,3 +208,4 @@ async def delete_prediction(
         )
 
     await db.delete(prediction)
+    after_commit(db, bump_group_version, prediction.group_id)
@@ -1,121 +1,192 @@
+import hashlib
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import case, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from app.auth import get_current_user
+from app.cache import TTLCache
 from app.database import get_db
-from app.models import Forecast, GroupMembership, Prediction, PredictionStatus, User
-from app.routers.groups import get_membership
+from app.etag import etag_matches
+from app.models import (
+    Forecast,
+    GroupMembership,
+    Prediction,
+    PredictionStatus,
+    User,
+    forecast_locked_in,
+)
+from app.routers.groups import require_membership
 from app.schemas import CalibrationBucket, LeaderboardEntry, UserStats
-from app.scoring import calculate_average_brier_score, calculate_calibration_buckets
+from app.scoring import calibration_bucket_expr
+from app.templating import group_version
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
+# Leaderboards and their ETags, keyed by group and group version; writes to a
+# group bump its version. Short-lived so other workers' writes show up soon.
+_leaderboards: TTLCache[tuple[list[dict], str]] = TTLCache(maxsize=1024, ttl=30)
 
-@router.get("/me", response_model=UserStats)
-async def get_my_stats(
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-) -> UserStats:
-    """Get stats for the current user across all groups."""
+
+async def calculate_leaderboard(db: AsyncSession, group_id: int) -> list[dict]:
+    """
+    Calculate leaderboard for a group in one aggregating query, ranked from 1.
+    Only locked-in forecasts (created before the lock-in deadline) on resolved
+    predictions count; ambiguous ones add to the count but not the average.
+    """
+    average = func.avg(Forecast.brier_score)
     result = await db.execute(
-        select(Forecast)
-        .options(selectinload(Forecast.prediction))
-        .where(Forecast.user_id == current_user.id)
+        select(
+            User.id,
+            User.email,
+            User.display_name,
+            average.label("average_brier_score"),
+            func.count().label("forecast_count"),
+        )
+        .join(Forecast, Forecast.user_id == User.id)
+        .join(Prediction, Prediction.id == Forecast.prediction_id)
+        .join(
+            GroupMembership,
+            (GroupMembership.user_id == User.id) & (GroupMembership.group_id == group_id),
+        )
+        .where(
+            Prediction.group_id == group_id,
+            Prediction.status != PredictionStatus.open,
+            forecast_locked_in,
+        )
+        .group_by(User.id, User.email, User.display_name)
+        .having(average.is_not(None))
+        # Lower is better
+        .order_by(average, User.id)
     )
-    forecasts = result.scalars().all()
-
-    # Only count forecasts that were locked in (created before lock-in deadline)
-    resolved_forecasts = [
-        (f.probability, f.prediction.status)
-        for f in forecasts
-        if f.prediction.status != PredictionStatus.open
-        and f.created_at < f.prediction.lock_in_at
+
+    return [
+        {
+            "rank": rank,
+            "user_id": user_id,
+            "email": email,
+            "display_name": display_name,
+            "average_brier_score": average_brier_score,
+            "forecast_count": forecast_count,
+        }
+        for rank, (user_id, email, display_name, average_brier_score, forecast_count)
+        in enumerate(result, start=1)
     ]
 
-    avg_score = calculate_average_brier_score(resolved_forecasts)
 
-    return UserStats(
-        user_id=current_user.id,
-        email=current_user.email,
-        display_name=current_user.display_name,
-        total_forecasts=len(forecasts),
-        resolved_forecasts=len(resolved_forecasts),
-        average_brier_score=avg_score,
+async def calculate_forecast_stats(
+    db: AsyncSession, user_id: int, group_id: int | None = None
+) -> dict:
+    """
+    A user's forecast counts and average Brier score in one aggregate,
+    optionally limited to one group. Averages the Brier scores stored at
+    resolution, which only locked-in forecasts on resolved predictions have.
+    """
+    resolved = (Prediction.status != PredictionStatus.open) & forecast_locked_in
+    stmt = (
+        select(
+            func.count().label("total_forecasts"),
+            func.count().filter(resolved).label("resolved_forecasts"),
+            func.avg(Forecast.brier_score).label("average_brier_score"),
+        )
+        .select_from(Forecast)
+        .join(Prediction, Prediction.id == Forecast.prediction_id)
+        .where(Forecast.user_id == user_id)
     )
+    if group_id is not None:
+        stmt = stmt.where(Prediction.group_id == group_id)
+    return (await db.execute(stmt)).one()._asdict()
 
 
-@router.get("/group/{group_id}/leaderboard", response_model=list[LeaderboardEntry])
-async def get_group_leaderboard(
-    group_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-) -> list[LeaderboardEntry]:
-    """Get the leaderboard for a group, sorted by average Brier score (lower is better)."""
-    membership = await get_membership(db, group_id, current_user.id)
-    if membership is None:
-        raise HTTPException(
-            status_code=404,
-            detail="Group not found or you are not a member",
+async def calculate_user_calibration(
+    db: AsyncSession, user_id: int, num_buckets: int = 10
+) -> list[CalibrationBucket]:
+    """
+    Calibration buckets over a user's locked-in forecasts with a yes/no
+    outcome, aggregated in SQL: one row per non-empty bucket.
+    """
+    bucket = calibration_bucket_expr(Forecast.probability, num_buckets).label("bucket")
+    actual = case((Prediction.status == PredictionStatus.resolved_yes, 1.0), else_=0.0)
+    result = await db.execute(
+        select(bucket, func.avg(Forecast.probability), func.avg(actual), func.count())
+        .join(Prediction, Prediction.id == Forecast.prediction_id)
+        .where(
+            Forecast.user_id == user_id,
+            Prediction.status.in_([PredictionStatus.resolved_yes, PredictionStatus.resolved_no]),
+            forecast_locked_in,
         )
-
-    members_result = await db.execute(
-        select(GroupMembership)
-        .options(selectinload(GroupMembership.user))
-        .where(GroupMembership.group_id == group_id)
+        # By label: PostgreSQL can't match the bucket's bound parameters
+        # in a repeated GROUP BY expression
+        .group_by("bucket")
+        .order_by("bucket")
     )
-    members = members_result.scalars().all()
 
-    prediction_ids_result = await db.execute(
-        select(Prediction.id).where(
-            Prediction.group_id == group_id,
-            Prediction.status != PredictionStatus.open,
-        )
-    )
-    resolved_prediction_ids = set(prediction_ids_result.scalars().all())
-
-    leaderboard = []
-    for member in members:
-        forecast_result = await db.execute(
-            select(Forecast)
-            .options(selectinload(Forecast.prediction))
-            .where(
-                Forecast.user_id == member.user_id,
-                Forecast.prediction_id.in_(resolved_prediction_ids),
-            )
+    bucket_size = 1.0 / num_buckets
+    return [
+        CalibrationBucket.model_construct(
+            bucket_start=index * bucket_size,
+            bucket_end=(index + 1) * bucket_size,
+            predicted_probability=predicted,
+            actual_frequency=frequency,
+            count=count,
         )
-        forecasts = forecast_result.scalars().all()
+        for index, predicted, frequency, count in result
+    ]
+
+
+async def cached_leaderboard(db: AsyncSession, group_id: int) -> tuple[list[dict], str]:
+    """The group's leaderboard and an ETag for it, computed only on a cache miss."""
+    key = (group_id, group_version(group_id))
+    cached = _leaderboards.get(key)
+    if cached is None:
+        entries = await calculate_leaderboard(db, group_id)
+        # From the content, so any worker gives the same leaderboard the same tag
+        etag = f'"{hashlib.blake2b(orjson.dumps(entries), digest_size=16).hexdigest()}"'
+        cached = (entries, etag)
+        _leaderboards.set(key, cached)
+    return cached
 
-        # Only count forecasts that were locked in (created before lock-in deadline)
-        locked_forecasts = [
-            f for f in forecasts
-            if f.created_at < f.prediction.lock_in_at
-        ]
 
-        if not locked_forecasts:
-            continue
+@router.get("/me", response_model=UserStats)
+async def get_my_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> UserStats:
+    """Get stats for the current user across all groups."""
+    stats = await calculate_forecast_stats(db, current_user.id)
 
-        forecast_data = [(f.probability, f.prediction.status) for f in locked_forecasts]
-        avg_score = calculate_average_brier_score(forecast_data)
+    return UserStats.model_construct(
+        user_id=current_user.id,
+        email=current_user.email,
+        display_name=current_user.display_name,
+        **stats,
+    )
 
-        if avg_score is not None:
-            leaderboard.append({
-                "user_id": member.user.id,
-                "email": member.user.email,
-                "display_name": member.user.display_name,
-                "average_brier_score": avg_score,
-                "forecast_count": len(locked_forecasts),
-            })
 
-    leaderboard.sort(key=lambda x: x["average_brier_score"])
+@router.get(
+    "/group/{group_id}/leaderboard",
+    response_model=list[LeaderboardEntry],
+    dependencies=[Depends(require_membership)],
+)
+async def get_group_leaderboard(
+    group_id: int,
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> list[LeaderboardEntry] | Response:
+    """
+    Get the leaderboard for a group, sorted by average Brier score (lower is better).
+    Answers 304 when If-None-Match carries the current ETag.
+    """
+    entries, etag = await cached_leaderboard(db, group_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-    return [
-        LeaderboardEntry(rank=i + 1, **entry)
-        for i, entry in enumerate(leaderboard)
-    ]
+    response.headers.update(headers)
+    return [LeaderboardEntry.model_construct(**entry) for entry in entries]
 
 
 @router.get("/me/calibration", response_model=list[CalibrationBucket])
@@ -124,79 +195,39 @@ async def get_my_calibration(
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> list[CalibrationBucket]:
     """Get calibration data for the current user."""
-    result = await db.execute(
-        select(Forecast)
-        .options(selectinload(Forecast.prediction))
-        .where(Forecast.user_id == current_user.id)
-    )
-    forecasts = result.scalars().all()
-
-    # Only count forecasts that were locked in (created before lock-in deadline)
-    resolved_forecasts = [
-        (f.probability, f.prediction.status)
-        for f in forecasts
-        if f.prediction.status != PredictionStatus.open
-        and f.created_at < f.prediction.lock_in_at
-    ]
+    return await calculate_user_calibration(db, current_user.id)
 
-    return calculate_calibration_buckets(resolved_forecasts)
 
-
-@router.get("/group/{group_id}/user/{user_id}", response_model=UserStats)
+@router.get(
+    "/group/{group_id}/user/{user_id}",
+    response_model=UserStats,
+    dependencies=[Depends(require_membership)],
+)
 async def get_user_stats_in_group(
     group_id: int,
     user_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> UserStats:
     """Get stats for a specific user in a group."""
-    membership = await get_membership(db, group_id, current_user.id)
-    if membership is None:
-        raise HTTPException(
-            status_code=404,
-            detail="Group not found or you are not a member",
+    # The target's profile, only if they belong to the group
+    target_user = (
+        await db.execute(
+            select(User.id, User.email, User.display_name)
+            .join(GroupMembership, GroupMembership.user_id == User.id)
+            .where(User.id == user_id, GroupMembership.group_id == group_id)
         )
-
-    target_membership = await get_membership(db, group_id, user_id)
-    if target_membership is None:
+    ).first()
+    if target_user is None:
         raise HTTPException(
             status_code=404,
             detail="User is not a member of this group",
         )
 
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    target_user = user_result.scalar_one()
-
-    prediction_ids_result = await db.execute(
-        select(Prediction.id).where(Prediction.group_id == group_id)
-    )
-    group_prediction_ids = set(prediction_ids_result.scalars().all())
-
-    forecast_result = await db.execute(
-        select(Forecast)
-        .options(selectinload(Forecast.prediction))
-        .where(
-            Forecast.user_id == user_id,
-            Forecast.prediction_id.in_(group_prediction_ids),
-        )
-    )
-    forecasts = forecast_result.scalars().all()
-
-    # Only count forecasts that were locked in (created before lock-in deadline)
-    resolved_forecasts = [
-        (f.probability, f.prediction.status)
-        for f in forecasts
-        if f.prediction.status != PredictionStatus.open
-        and f.created_at < f.prediction.lock_in_at
-    ]
-
-    avg_score = calculate_average_brier_score(resolved_forecasts)
+    stats = await calculate_forecast_stats(db, user_id, group_id)
 
-    return UserStats(
+    return UserStats.model_construct(
         user_id=target_user.id,
         email=target_user.email,
         display_name=target_user.display_name,
-        total_forecasts=len(forecasts),
-        resolved_forecasts=len(resolved_forecasts),
-        average_brier_score=avg_score,
+        **stats,
     )
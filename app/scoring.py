@@ -1,8 +1,19 @@
-from collections import defaultdict
+from collections.abc import Iterable
 
-from app.models import Forecast, PredictionStatus
+from sqlalchemy import ColumnElement, Integer, Update, case, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from app.models import Forecast, Prediction, PredictionStatus, forecast_locked_in
 from app.schemas import CalibrationBucket
 
+# Actual outcome of each resolved status. A dict lookup is cheaper than
+# comparing enum members, and open/ambiguous fall through as unscored.
+_OUTCOMES: dict[PredictionStatus, float] = {
+    PredictionStatus.resolved_yes: 1.0,
+    PredictionStatus.resolved_no: 0.0,
+}
+
 
 def calculate_brier_score(probability: float, outcome: PredictionStatus) -> float | None:
     """
@@ -13,34 +24,110 @@ def calculate_brier_score(probability: float, outcome: PredictionStatus) -> floa
     - 0.25 = no information (always predicting 50%)
     - 1 = maximally wrong
 
-    Returns None for ambiguous outcomes.
+    Returns None for open and ambiguous outcomes.
     """
-    if outcome == PredictionStatus.ambiguous:
+    actual = _OUTCOMES.get(outcome)
+    if actual is None:
         return None
 
-    actual = 1.0 if outcome == PredictionStatus.resolved_yes else 0.0
-    return (probability - actual) ** 2
+    # Multiplying is cheaper than ** 2 for a float
+    error = probability - actual
+    return error * error
 
 
-def calculate_average_brier_score(forecasts: list[tuple[float, PredictionStatus]]) -> float | None:
+def brier_score_expr(
+    probability: ColumnElement[float], outcome: ColumnElement[PredictionStatus]
+) -> ColumnElement[float | None]:
+    """
+    SQL form of calculate_brier_score.
+    NULL for open and ambiguous outcomes, so AVG() skips them.
+    """
+    return case(
+        (outcome == PredictionStatus.resolved_yes, (1.0 - probability) * (1.0 - probability)),
+        (outcome == PredictionStatus.resolved_no, probability * probability),
+    )
+
+
+def store_brier_scores(prediction_id: int) -> Update:
+    """
+    UPDATE that stores the Brier score of each locked-in forecast on a
+    prediction, from its resolved status. Run it in the transaction that
+    resolves the prediction; stats then average the stored scores.
+    """
+    return (
+        update(Forecast)
+        .where(
+            Forecast.prediction_id == Prediction.id,
+            Prediction.id == prediction_id,
+            forecast_locked_in,
+        )
+        .values(
+            brier_score=brier_score_expr(Forecast.probability, Prediction.status),
+            # Scoring is not an edit by the forecaster; skip the onupdate
+            updated_at=Forecast.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+class int_floor(FunctionElement):
+    """SQL floor of a non-negative number, as an integer: int_floor(value)."""
+
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(int_floor)
+def _compile_int_floor(element, compiler, **kw) -> str:
+    (value,) = (compiler.process(arg, **kw) for arg in element.clauses)
+    # A bare CAST rounds on PostgreSQL
+    return f"CAST(FLOOR({value}) AS INTEGER)"
+
+
+@compiles(int_floor, "sqlite")
+def _compile_int_floor_sqlite(element, compiler, **kw) -> str:
+    # FLOOR() is missing from some SQLite builds; CAST truncates, which is
+    # the floor for non-negative values
+    (value,) = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"CAST({value} AS INTEGER)"
+
+
+def calibration_bucket_expr(
+    probability: ColumnElement[float], num_buckets: int = 10
+) -> ColumnElement[int]:
+    """SQL form of the bucket index calculate_calibration_buckets assigns."""
+    index = int_floor(probability / (1.0 / num_buckets))
+    return case((index > num_buckets - 1, num_buckets - 1), else_=index)
+
+
+def calculate_average_brier_score(
+    forecasts: Iterable[tuple[float, PredictionStatus]]
+) -> float | None:
     """
     Calculate average Brier score across multiple forecasts.
     Excludes ambiguous outcomes.
+
+    Scores are summed in a single pass, without a per-forecast call or a
+    list of intermediate scores.
     """
-    scores = []
+    total = 0.0
+    count = 0
     for probability, outcome in forecasts:
-        score = calculate_brier_score(probability, outcome)
-        if score is not None:
-            scores.append(score)
+        actual = _OUTCOMES.get(outcome)
+        if actual is None:
+            continue
+        error = probability - actual
+        total += error * error
+        count += 1
 
-    if not scores:
+    if not count:
         return None
 
-    return sum(scores) / len(scores)
+    return total / count
 
 
 def calculate_calibration_buckets(
-    forecasts: list[tuple[float, PredictionStatus]],
+    forecasts: Iterable[tuple[float, PredictionStatus]],
     num_buckets: int = 10
 ) -> list[CalibrationBucket]:
     """
@@ -51,36 +138,40 @@ def calculate_calibration_buckets(
 
     A perfectly calibrated forecaster would have predicted probability ≈ actual frequency
     in each bucket.
+
+    forecasts is consumed once, so result rows can be passed in directly.
     """
     bucket_size = 1.0 / num_buckets
-    buckets: dict[int, list[tuple[float, float]]] = defaultdict(list)
+    last = num_buckets - 1
+    # Running sums per bucket, so no per-forecast tuples or lists are built
+    probability_sums = [0.0] * num_buckets
+    yes_counts = [0.0] * num_buckets
+    counts = [0] * num_buckets
 
     for probability, outcome in forecasts:
-        if outcome == PredictionStatus.ambiguous:
+        actual = _OUTCOMES.get(outcome)
+        if actual is None:
             continue
 
-        actual = 1.0 if outcome == PredictionStatus.resolved_yes else 0.0
-        bucket_idx = min(int(probability / bucket_size), num_buckets - 1)
-        buckets[bucket_idx].append((probability, actual))
+        # Same index as calibration_bucket_expr, so SQL and Python agree
+        bucket_idx = int(probability / bucket_size)
+        if bucket_idx > last:
+            bucket_idx = last
+        probability_sums[bucket_idx] += probability
+        yes_counts[bucket_idx] += actual
+        counts[bucket_idx] += 1
 
     result = []
-    for i in range(num_buckets):
-        bucket_start = i * bucket_size
-        bucket_end = (i + 1) * bucket_size
-
-        items = buckets.get(i, [])
-        if not items:
+    for i, count in enumerate(counts):
+        if not count:
             continue
 
-        predicted_avg = sum(p for p, _ in items) / len(items)
-        actual_freq = sum(a for _, a in items) / len(items)
-
         result.append(CalibrationBucket(
-            bucket_start=bucket_start,
-            bucket_end=bucket_end,
-            predicted_probability=predicted_avg,
-            actual_frequency=actual_freq,
-            count=len(items)
+            bucket_start=i * bucket_size,
+            bucket_end=(i + 1) * bucket_size,
+            predicted_probability=probability_sums[i] / count,
+            actual_frequency=yes_counts[i] / count,
+            count=count
         ))
 
     return result
@@ -0,0 +1,117 @@
+import os
+import time
+from collections import defaultdict
+from collections.abc import Callable, Hashable
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.cache import TTLCache
+from app.config import get_settings
+
+settings = get_settings()
+
+# Rendered template fragments, keyed by the key parts of their {% cache %} tag
+_fragments: TTLCache[Markup] = TTLCache(maxsize=10_000, ttl=30)
+
+# Whole HTMX partial response bodies, so a hit skips the queries as well as
+# the render. Keys carry a group or content version, like fragment keys.
+_partials: TTLCache[bytes] = TTLCache(maxsize=10_000, ttl=10)
+
+# Bumped on every write that changes what a group's pages show. Cache keys
+# include the version, so a write makes the old fragments unreachable.
+_group_versions: defaultdict[int, int] = defaultdict(int)
+_content_version = 0
+
+
+def bump_group_version(group_id: int) -> None:
+    """Invalidate cached fragments for a group (and every all-groups view)."""
+    global _content_version
+    _group_versions[group_id] += 1
+    _content_version += 1
+
+
+def group_version(group_id: int) -> int:
+    return _group_versions.get(group_id, 0)
+
+
+def content_version() -> int:
+    """Version across all groups, for views that span several of them."""
+    return _content_version
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Cache the rendered body of a block in process:
+
+        {% cache 30, "feed", user.id, group_version(group_id) %}...{% endcache %}
+
+    The first argument is the lifetime in seconds; the rest form the key.
+    Fragments are per worker, so other workers' writes show up within the TTL.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser: jinja2.parser.Parser) -> nodes.Node:
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cached_render", [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cached_render(self, args: list, caller: Callable[[], str]) -> Markup:
+        ttl, *key_parts = args
+        key: Hashable = tuple(key_parts)
+        fragment = _fragments.get(key)
+        if fragment is None:
+            fragment = Markup(caller())
+            _fragments.set(key, fragment, expires_at=time.time() + ttl)
+        return fragment
+
+
+def cached_partial(key: Hashable) -> bytes | None:
+    return _partials.get(key)
+
+
+def cache_partial(key: Hashable, body: bytes) -> None:
+    _partials.set(key, body)
+
+
+def clear_fragments() -> None:
+    _fragments.clear()
+    _partials.clear()
+
+
+def _bytecode_cache() -> jinja2.FileSystemBytecodeCache:
+    """Persist compiled templates so worker restarts skip parsing and compiling."""
+    if not settings.template_cache_dir:
+        return jinja2.FileSystemBytecodeCache()
+    os.makedirs(settings.template_cache_dir, exist_ok=True)
+    return jinja2.FileSystemBytecodeCache(settings.template_cache_dir)
+
+
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("templates"),
+    autoescape=True,
+    extensions=[FragmentCacheExtension],
+    # Entries are keyed by a checksum of the source, so edits are picked up
+    bytecode_cache=_bytecode_cache(),
+)
+environment.globals.update(
+    group_version=group_version,
+    content_version=content_version,
+)
+
+templates = Jinja2Templates(env=environment)
+
+
+def warm_templates() -> None:
+    """Load and compile every template up front, so first requests skip it."""
+    for name in environment.list_templates(extensions=["html"]):
+        environment.get_template(name)
@@ -0,0 +1,47 @@
+"""Composite indexes on group memberships
+
+Aborts, changing nothing, if any user has more than one membership in a
+group: the duplicates may carry different roles, so resolve the listed
+ones by hand (keeping the intended role) and rerun. No rows are deleted.
+
+Revision ID: 551b1251cbfd
+Revises: de2ab3197b88
+Create Date: 2026-10-15 10:04:17.662190
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '551b1251cbfd'
+down_revision: Union[str, Sequence[str], None] = 'de2ab3197b88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Offline (--sql) runs cannot query; the CREATE INDEX fails on duplicates
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(sa.text(
+            "SELECT group_id, user_id, COUNT(*) FROM group_memberships "
+            "GROUP BY group_id, user_id HAVING COUNT(*) > 1"
+        )).all()
+        if duplicates:
+            raise RuntimeError(
+                f"{len(duplicates)} users have more than one membership in a group "
+                f"(group_id, user_id, count): {[tuple(row) for row in duplicates[:5]]}. "
+                "Remove the extras by hand, keeping the intended role, then rerun "
+                "this migration."
+            )
+    op.create_index('uq_memberships_group_user', 'group_memberships', ['group_id', 'user_id'], unique=True)
+    op.create_index('ix_memberships_user_group', 'group_memberships', ['user_id', 'group_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_memberships_user_group', table_name='group_memberships')
+    op.drop_index('uq_memberships_group_user', table_name='group_memberships')
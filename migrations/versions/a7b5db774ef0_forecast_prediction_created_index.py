@@ -0,0 +1,27 @@
+"""Index forecasts by prediction and creation time
+
+Revision ID: a7b5db774ef0
+Revises: 551b1251cbfd
+Create Date: 2026-10-15 11:02:41.318554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b5db774ef0'
+down_revision: Union[str, Sequence[str], None] = '551b1251cbfd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_forecast_pred_created', 'forecasts', ['prediction_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_forecast_pred_created', table_name='forecasts')
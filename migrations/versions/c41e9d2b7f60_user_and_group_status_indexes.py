@@ -0,0 +1,31 @@
+"""Index forecasts by user and predictions by group and status
+
+Revision ID: c41e9d2b7f60
+Revises: a7b5db774ef0
+Create Date: 2026-10-15 12:41:08.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e9d2b7f60'
+down_revision: Union[str, Sequence[str], None] = 'a7b5db774ef0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_prediction_group_status', 'predictions', ['group_id', 'status'], unique=False)
+    op.create_index('ix_forecast_user_pred', 'forecasts', ['user_id', 'prediction_id'], unique=False)
+    op.create_index('ix_forecast_user_created', 'forecasts', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_forecast_user_created', table_name='forecasts')
+    op.drop_index('ix_forecast_user_pred', table_name='forecasts')
+    op.drop_index('ix_prediction_group_status', table_name='predictions')
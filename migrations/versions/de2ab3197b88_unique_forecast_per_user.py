@@ -0,0 +1,44 @@
+"""Unique forecast per user per prediction
+
+Aborts, changing nothing, if any user already has more than one forecast
+on a prediction: which one to keep is a product decision, so resolve the
+listed duplicates by hand and rerun. No rows are deleted.
+
+Revision ID: de2ab3197b88
+Revises: 3f26572e119b
+Create Date: 2026-10-15 09:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'de2ab3197b88'
+down_revision: Union[str, Sequence[str], None] = '3f26572e119b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Offline (--sql) runs cannot query; the CREATE INDEX fails on duplicates
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(sa.text(
+            "SELECT prediction_id, user_id, COUNT(*) FROM forecasts "
+            "GROUP BY prediction_id, user_id HAVING COUNT(*) > 1"
+        )).all()
+        if duplicates:
+            raise RuntimeError(
+                f"{len(duplicates)} users have more than one forecast on a prediction "
+                f"(prediction_id, user_id, count): {[tuple(row) for row in duplicates[:5]]}. "
+                "Remove the extra forecasts by hand, then rerun this migration."
+            )
+    op.create_index('uq_forecast_pred_user', 'forecasts', ['prediction_id', 'user_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_forecast_pred_user', table_name='forecasts')
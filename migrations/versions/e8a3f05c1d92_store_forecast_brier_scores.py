@@ -0,0 +1,78 @@
+"""Store each forecast's Brier score at resolution
+
+Revision ID: e8a3f05c1d92
+Revises: c41e9d2b7f60
+Create Date: 2026-10-15 13:06:52.417930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a3f05c1d92'
+down_revision: Union[str, Sequence[str], None] = 'c41e9d2b7f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('forecasts', sa.Column('brier_score', sa.Float(), nullable=True))
+
+    # Score locked-in forecasts on predictions that are already resolved.
+    # Lock-in is 75% of the way from creation to resolution.
+    forecasts = sa.table(
+        'forecasts',
+        sa.column('prediction_id', sa.Integer),
+        sa.column('probability', sa.Float),
+        sa.column('brier_score', sa.Float),
+        sa.column('created_at', sa.DateTime),
+    )
+    predictions = sa.table(
+        'predictions',
+        sa.column('id', sa.Integer),
+        # The enum type from 3f26572e119b: on PostgreSQL a VARCHAR comparison
+        # with it has no operator. sa.table() never creates the type.
+        sa.column('status', sa.Enum(
+            'open', 'resolved_yes', 'resolved_no', 'ambiguous', name='predictionstatus'
+        )),
+        sa.column('created_at', sa.DateTime),
+        sa.column('resolution_date', sa.DateTime),
+    )
+    # Spelled out here rather than imported from app.models, so later model
+    # changes cannot alter this migration
+    created_at, resolution_date = predictions.c.created_at, predictions.c.resolution_date
+    if op.get_bind().dialect.name == 'sqlite':
+        # As Julian days: the deadline as text would be rounded to the
+        # millisecond, making earlier forecasts in that millisecond late
+        locked_in = sa.func.julianday(forecasts.c.created_at) < (
+            sa.func.julianday(created_at)
+            + (sa.func.julianday(resolution_date) - sa.func.julianday(created_at)) * 0.75
+        )
+    else:
+        locked_in = forecasts.c.created_at < sa.literal_column(
+            'predictions.created_at'
+            ' + (predictions.resolution_date - predictions.created_at) * 0.75',
+            sa.DateTime,
+        )
+
+    probability = forecasts.c.probability
+    op.execute(
+        sa.update(forecasts)
+        .where(
+            forecasts.c.prediction_id == predictions.c.id,
+            locked_in,
+        )
+        .values(brier_score=sa.case(
+            (predictions.c.status == 'resolved_yes', (1.0 - probability) * (1.0 - probability)),
+            (predictions.c.status == 'resolved_no', probability * probability),
+        ))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('forecasts', 'brier_score')
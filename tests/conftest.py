@@ -1,51 +1,101 @@
-import asyncio
+import functools
 from collections.abc import AsyncGenerator
 
 import pytest
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
 
-from app.auth import create_access_token
+from app.auth import _cached_users, create_access_token
 from app.database import Base, get_db
 from app.main import app
 from app.models import User
+from app.routers.groups import _user_groups, join_attempts
+from app.routers.stats import _leaderboards
+from app.templating import clear_fragments
 
-# Use in-memory SQLite for tests
+# Use in-memory SQLite for tests; each pytest-xdist worker process gets its own
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_async_engine(TEST_DATABASE_URL, echo=False)
-async_session_maker = async_sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
-)
+# One shared connection: the in-memory database lives only as long as it does
+engine = create_async_engine(TEST_DATABASE_URL, echo=False, poolclass=StaticPool)
 
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+# The sqlite3 driver defers BEGIN and ignores SAVEPOINT transaction state;
+# emit BEGIN ourselves so each test's outer transaction can be rolled back
+@event.listens_for(engine.sync_engine, "connect")
+def _disable_driver_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
 
 
-@pytest.fixture
-async def db() -> AsyncGenerator[AsyncSession, None]:
-    """Create tables and yield a database session."""
+@event.listens_for(engine.sync_engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Reset in-process caches; rolled-back tests reuse the same ids."""
+    yield
+    _user_groups.clear()
+    _cached_users.clear()
+    join_attempts.clear()
+    _leaderboards.clear()
+    clear_fragments()
+
+
+# Created with the schema, outside any test's transaction, so every
+# rollback leaves them in place
+_users: tuple[User, User] | None = None
+
+
+async def _create_schema() -> tuple[User, User]:
+    """Create the tables and seed both test users, once per process."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(bind=conn) as session:
+            users = (
+                User(email="test@example.com", display_name="Test User"),
+                User(email="second@example.com", display_name="Second User"),
+            )
+            session.add_all(users)
+            # The INSERTs return id and created_at; engine.begin() commits
+            await session.flush()
+    return users
 
-    async with async_session_maker() as session:
-        yield session
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+@pytest.fixture
+async def db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Yield a session inside a transaction that is rolled back after the test.
+    Tables are created once; commits in the test only release savepoints.
+    """
+    global _users
+    if _users is None:
+        _users = await _create_schema()
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        session = AsyncSession(
+            bind=conn,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
+        yield session
+        await session.close()
+        await transaction.rollback()
 
 
 @pytest.fixture
 async def client(db: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     """Create a test client with database override."""
 
-    async def override_get_db():
+    # Commits after the handler like DBSessionMiddleware, so after_commit
+    # hooks run; in the test transaction that only releases a savepoint
+    async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
         yield db
+        await db.commit()
 
     app.dependency_overrides[get_db] = override_get_db
 
@@ -59,34 +109,36 @@ async def client(db: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
 
 
 @pytest.fixture
-async def test_user(db: AsyncSession) -> User:
-    """Create a test user."""
-    user = User(email="test@example.com", display_name="Test User")
-    db.add(user)
-    await db.commit()
-    await db.refresh(user)
-    return user
+def users(db: AsyncSession) -> tuple[User, User]:
+    """Both test users, seeded with the schema (detached, so read-only here)."""
+    return _users
+
+
+@pytest.fixture
+def test_user(users: tuple[User, User]) -> User:
+    """The first test user."""
+    return users[0]
+
+
+@functools.cache
+def _access_token(user_id: int) -> str:
+    """Sign each user id's token once; rolled-back tests reuse the same ids."""
+    return create_access_token(user_id)
 
 
 @pytest.fixture
-async def auth_headers(test_user: User) -> dict[str, str]:
+def auth_headers(test_user: User) -> dict[str, str]:
     """Get auth headers for the test user."""
-    token = create_access_token(test_user.id)
-    return {"Authorization": f"Bearer {token}"}
+    return {"Authorization": f"Bearer {_access_token(test_user.id)}"}
 
 
 @pytest.fixture
-async def second_user(db: AsyncSession) -> User:
-    """Create a second test user."""
-    user = User(email="second@example.com", display_name="Second User")
-    db.add(user)
-    await db.commit()
-    await db.refresh(user)
-    return user
+def second_user(users: tuple[User, User]) -> User:
+    """The second test user."""
+    return users[1]
 
 
 @pytest.fixture
-async def second_auth_headers(second_user: User) -> dict[str, str]:
+def second_auth_headers(second_user: User) -> dict[str, str]:
     """Get auth headers for the second user."""
-    token = create_access_token(second_user.id)
-    return {"Authorization": f"Bearer {token}"}
+    return {"Authorization": f"Bearer {_access_token(second_user.id)}"}
@@ -1,7 +1,18 @@
+import asyncio
+
 import pytest
 from httpx import AsyncClient
-
-from app.auth import create_magic_link_token, verify_magic_link_token
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import (
+    _verified_tokens,
+    create_access_token,
+    create_magic_link_token,
+    get_cached_user,
+    verify_access_token,
+    verify_magic_link_token,
+    wait_for_pending_sends,
+)
 from app.models import User
 
 
@@ -24,6 +35,31 @@ class TestMagicLinkTokens:
         result = verify_magic_link_token(tampered)
         assert result is None
 
+    def test_wrong_token_type_returns_none(self):
+        token = create_magic_link_token("test@example.com")
+        assert verify_access_token(token) is None
+
+
+class TestTokenCache:
+    def test_verified_token_is_cached(self):
+        token = create_access_token(42)
+        assert verify_access_token(token) == 42
+        assert _verified_tokens.get(token) is not None
+
+        # A cache hit returns the same user without re-decoding
+        assert verify_access_token(token) == 42
+
+    def test_invalid_token_is_not_cached(self):
+        assert verify_access_token("invalid-token") is None
+        assert _verified_tokens.get("invalid-token") is None
+
+    def test_expired_cache_entry_is_not_served(self):
+        token = create_access_token(42)
+        verify_access_token(token)
+        _verified_tokens.set(token, {"sub": "42", "type": "access"}, expires_at=0)
+
+        assert _verified_tokens.get(token) is None
+
 
 class TestAuthEndpoints:
     @pytest.mark.asyncio
@@ -35,6 +71,31 @@ class TestAuthEndpoints:
         assert response.status_code == 200
         assert response.json()["message"] == "Magic link sent to your email"
 
+    @pytest.mark.asyncio
+    async def test_request_magic_link_does_not_wait_for_email(
+        self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        release = asyncio.Event()
+        sent: list[str] = []
+
+        async def slow_send(email: str, magic_link: str) -> bool:
+            await release.wait()
+            sent.append(email)
+            return True
+
+        monkeypatch.setattr("app.routers.auth.send_magic_link_email", slow_send)
+
+        response = await client.post(
+            "/api/auth/magic-link",
+            json={"email": "slow@example.com"},
+        )
+        assert response.status_code == 200
+        assert sent == []
+
+        release.set()
+        await wait_for_pending_sends()
+        assert sent == ["slow@example.com"]
+
     @pytest.mark.asyncio
     async def test_request_magic_link_invalid_email(self, client: AsyncClient):
         response = await client.post(
@@ -79,6 +140,29 @@ class TestAuthEndpoints:
         assert data["email"] == test_user.email
         assert data["id"] == test_user.id
 
+    @pytest.mark.asyncio
+    async def test_get_me_etag_not_modified(
+        self, client: AsyncClient, test_user: User, auth_headers: dict
+    ):
+        response = await client.get("/api/auth/me", headers=auth_headers)
+        assert response.headers["cache-control"] == "private, max-age=30"
+        etag = response.headers["etag"]
+
+        response = await client.get(
+            "/api/auth/me", headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+
+        await client.patch(
+            "/api/auth/me", headers=auth_headers, json={"display_name": "Renamed"}
+        )
+        response = await client.get(
+            "/api/auth/me", headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.json()["display_name"] == "Renamed"
+
     @pytest.mark.asyncio
     async def test_get_me_unauthorized(self, client: AsyncClient):
         response = await client.get("/api/auth/me")
@@ -104,3 +188,17 @@ class TestAuthEndpoints:
 
         assert response.status_code == 200
         assert response.json()["display_name"] == "New Name"
+
+    @pytest.mark.asyncio
+    async def test_update_me_refreshes_cached_user(
+        self, client: AsyncClient, test_user: User, auth_headers: dict, db: AsyncSession
+    ):
+        cached = await get_cached_user(db, test_user.id)
+        assert cached.display_name == "Test User"
+
+        await client.patch(
+            "/api/auth/me", headers=auth_headers, json={"display_name": "Renamed"}
+        )
+
+        cached = await get_cached_user(db, test_user.id)
+        assert cached.display_name == "Renamed"
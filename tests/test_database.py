@@ -0,0 +1,167 @@
+from collections.abc import AsyncGenerator
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import bindparam, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.database import DBSessionMiddleware, after_commit, get_db
+from app.main import app
+from app.models import Group, GroupMembership, GroupRole, User
+from app.routers import groups
+
+# Writes a group, then answers with the requested status
+_write_app = FastAPI()
+_write_app.add_middleware(DBSessionMiddleware)
+
+
+@_write_app.post("/groups")
+async def _create_group(status_code: int, db: AsyncSession = Depends(get_db)) -> dict:
+    db.add(Group(name="Middleware Test"))
+    await db.flush()
+    if status_code >= 400:
+        raise HTTPException(status_code=status_code)
+    return {}
+
+
+@pytest.fixture
+def request_sessions(db: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Let DBSessionMiddleware open its own sessions, on the test's connection,
+    so its commits and rollbacks stay inside the test's transaction.
+    """
+    monkeypatch.setattr(
+        "app.database.async_session_maker",
+        async_sessionmaker(
+            bind=db.bind,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        ),
+    )
+
+
+@pytest.fixture
+async def write_client(request_sessions: None) -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(
+        transport=ASGITransport(app=_write_app), base_url="http://test"
+    ) as ac:
+        yield ac
+
+
+@pytest.fixture
+async def app_client(request_sessions: None) -> AsyncGenerator[AsyncClient, None]:
+    """Client for the real app, without the get_db override."""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
+
+
+async def _group_count(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(Group))
+
+
+class TestDBSessionMiddleware:
+    @pytest.mark.asyncio
+    async def test_commits_on_success(self, write_client: AsyncClient, db: AsyncSession):
+        response = await write_client.post("/groups?status_code=200")
+
+        assert response.status_code == 200
+        assert await _group_count(db) == 1
+
+    @pytest.mark.asyncio
+    async def test_rolls_back_on_error_response(
+        self, write_client: AsyncClient, db: AsyncSession
+    ):
+        response = await write_client.post("/groups?status_code=400")
+
+        assert response.status_code == 400
+        assert await _group_count(db) == 0
+
+    @pytest.mark.asyncio
+    async def test_join_invalidates_listing_after_commit(
+        self,
+        app_client: AsyncClient,
+        second_auth_headers: dict,
+        test_user: User,
+        db: AsyncSession,
+    ):
+        group = Group(name="Committed Join")
+        db.add_all([
+            group,
+            GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin),
+        ])
+        await db.commit()
+
+        response = await app_client.get("/api/groups", headers=second_auth_headers)
+        assert response.json() == []
+
+        response = await app_client.post(
+            f"/api/groups/join?invite_code={group.invite_code}",
+            headers=second_auth_headers,
+        )
+        assert response.status_code == 200
+
+        response = await app_client.get("/api/groups", headers=second_auth_headers)
+        assert [g["name"] for g in response.json()] == ["Committed Join"]
+
+    @pytest.mark.asyncio
+    async def test_racing_join_is_a_client_error(
+        self,
+        app_client: AsyncClient,
+        auth_headers: dict,
+        test_user: User,
+        db: AsyncSession,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        group = Group(name="Racing Join")
+        db.add_all([
+            group,
+            GroupMembership(user_id=test_user.id, group=group, role=GroupRole.member),
+        ])
+        await db.commit()
+
+        # As if a concurrent join committed between the check and the insert
+        monkeypatch.setattr(
+            groups,
+            "_STMT_GROUP_BY_INVITE",
+            select(Group, literal(False).label("already_member")).where(
+                Group.invite_code == bindparam("invite_code")
+            ),
+        )
+
+        response = await app_client.post(
+            f"/api/groups/join?invite_code={group.invite_code}",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 400
+        assert "Already a member" in response.json()["detail"]
+        memberships = await db.scalar(
+            select(func.count()).where(GroupMembership.group_id == group.id)
+        )
+        assert memberships == 1
+
+
+class TestAfterCommit:
+    @pytest.mark.asyncio
+    async def test_runs_only_once_committed(self, db: AsyncSession):
+        calls = []
+        db.add(Group(name="Rolled Back"))
+        await db.flush()
+        after_commit(db, calls.append, "rolled back")
+        await db.rollback()
+        assert calls == []
+
+        after_commit(db, calls.append, "committed")
+        await db.commit()
+        assert calls == ["committed"]
+
+    @pytest.mark.asyncio
+    async def test_savepoint_rollback_keeps_callbacks(self, db: AsyncSession):
+        calls = []
+        after_commit(db, calls.append, "outer")
+        async with db.begin_nested() as savepoint:
+            await savepoint.rollback()
+
+        await db.commit()
+        assert calls == ["outer"]
@@ -0,0 +1,24 @@
+from app.etag import etag_matches
+
+ETAG = '"abc123"'
+
+
+class TestEtagMatches:
+    def test_exact_tag(self):
+        assert etag_matches('"abc123"', ETAG)
+
+    def test_tag_in_list(self):
+        assert etag_matches('"old", "abc123" , "other"', ETAG)
+
+    def test_weak_comparison(self):
+        assert etag_matches('W/"abc123"', ETAG)
+        assert etag_matches('"abc123"', 'W/"abc123"')
+
+    def test_wildcard(self):
+        assert etag_matches("*", ETAG)
+
+    def test_no_match(self):
+        assert not etag_matches(None, ETAG)
+        assert not etag_matches("", ETAG)
+        assert not etag_matches('"abc"', ETAG)
+        assert not etag_matches("abc123", ETAG)
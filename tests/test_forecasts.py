@@ -1,7 +1,9 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import (
@@ -14,8 +16,8 @@ from app.models import (
     User,
 )
 
-# Helper: far future date for tests
-FUTURE_DATE = datetime.utcnow() + timedelta(days=365)
+# Helper: fixed far-future date for tests, independent of import time
+FUTURE_DATE = datetime(2099, 1, 1)
 
 
 @pytest.fixture
@@ -23,26 +25,20 @@ async def group_with_prediction(
     db: AsyncSession, test_user: User
 ) -> tuple[Group, Prediction]:
     """Create a group with a prediction."""
+    # Linked through relationships, so one flush inserts all three
     group = Group(name="Forecast Test Group")
-    db.add(group)
-    await db.flush()
-
-    membership = GroupMembership(
-        user_id=test_user.id, group_id=group.id, role=GroupRole.admin
-    )
-    db.add(membership)
-    await db.flush()
-
     prediction = Prediction(
-        group_id=group.id,
+        group=group,
         creator_id=test_user.id,
         title="Test Prediction",
         resolution_date=FUTURE_DATE,
     )
-    db.add(prediction)
+    db.add_all([
+        group,
+        GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin),
+        prediction,
+    ])
     await db.commit()
-    await db.refresh(group)
-    await db.refresh(prediction)
 
     return group, prediction
 
@@ -138,27 +134,20 @@ class TestForecastEndpoints:
         db: AsyncSession,
         test_user: User,
     ):
-        # Create group without test user
+        # Create group without test user, and another user as its member
         group = Group(name="Other Group")
-        db.add(group)
-        await db.flush()
-
-        # Create another user as member
         other_user = User(email="other@example.com")
-        db.add(other_user)
-        await db.flush()
-
-        db.add(GroupMembership(user_id=other_user.id, group_id=group.id, role=GroupRole.admin))
-
         prediction = Prediction(
-            group_id=group.id,
-            creator_id=other_user.id,
+            group=group,
+            creator=other_user,
             title="Not My Prediction",
             resolution_date=FUTURE_DATE,
         )
-        db.add(prediction)
+        db.add_all([
+            GroupMembership(user=other_user, group=group, role=GroupRole.admin),
+            prediction,
+        ])
         await db.commit()
-        await db.refresh(prediction)
 
         response = await client.post(
             "/api/forecasts",
@@ -187,6 +176,47 @@ class TestForecastEndpoints:
         assert response.status_code == 400
         assert "resolved" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_create_forecast_on_locked_prediction(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        group_with_prediction: tuple[Group, Prediction],
+        test_user: User,
+        db: AsyncSession,
+    ):
+        group, _ = group_with_prediction
+
+        # 90% of the way from creation to resolution: past the 75% lock-in
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        prediction = Prediction(
+            group_id=group.id,
+            creator_id=test_user.id,
+            title="Locked Prediction",
+            created_at=now - timedelta(days=9),
+            resolution_date=now + timedelta(days=1),
+        )
+        db.add(prediction)
+        await db.commit()
+        assert prediction.is_locked
+        assert prediction.time_until_lock is None
+        lock_in_at = prediction.lock_in_at
+        assert lock_in_at.tzinfo is None
+        assert abs(lock_in_at - (now - timedelta(days=1.5))) < timedelta(milliseconds=1)
+
+        # Follows a changed resolution date rather than a value cached earlier
+        prediction.resolution_date = now + timedelta(days=100)
+        assert not prediction.is_locked
+        prediction.resolution_date = now + timedelta(days=1)
+
+        response = await client.post(
+            "/api/forecasts",
+            headers=auth_headers,
+            json={"prediction_id": prediction.id, "probability": 0.5},
+        )
+        assert response.status_code == 400
+        assert "locked" in response.json()["detail"]
+
     @pytest.mark.asyncio
     async def test_create_duplicate_forecast(
         self,
@@ -216,6 +246,23 @@ class TestForecastEndpoints:
         assert response.status_code == 400
         assert "already have a forecast" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_duplicate_forecast_rejected_by_database(
+        self,
+        group_with_prediction: tuple[Group, Prediction],
+        test_user: User,
+        db: AsyncSession,
+    ):
+        _, prediction = group_with_prediction
+
+        db.add(Forecast(prediction_id=prediction.id, user_id=test_user.id, probability=0.5))
+        await db.commit()
+
+        db.add(Forecast(prediction_id=prediction.id, user_id=test_user.id, probability=0.6))
+        with pytest.raises(IntegrityError):
+            await db.flush()
+        await db.rollback()
+
     @pytest.mark.asyncio
     async def test_update_forecast(
         self,
@@ -234,7 +281,6 @@ class TestForecastEndpoints:
         )
         db.add(forecast)
         await db.commit()
-        await db.refresh(forecast)
 
         response = await client.patch(
             f"/api/forecasts/{forecast.id}",
@@ -272,7 +318,6 @@ class TestForecastEndpoints:
         )
         db.add(forecast)
         await db.commit()
-        await db.refresh(forecast)
 
         # Second user tries to update it
         response = await client.patch(
@@ -299,11 +344,8 @@ class TestForecastEndpoints:
             probability=0.5,
         )
         db.add(forecast)
-        await db.flush()
-
         prediction.status = PredictionStatus.resolved_no
         await db.commit()
-        await db.refresh(forecast)
 
         response = await client.patch(
             f"/api/forecasts/{forecast.id}",
@@ -327,9 +369,13 @@ class TestForecastEndpoints:
         db.add(GroupMembership(
             user_id=second_user.id, group_id=group.id, role=GroupRole.member
         ))
-
-        db.add(Forecast(prediction_id=prediction.id, user_id=test_user.id, probability=0.3))
-        db.add(Forecast(prediction_id=prediction.id, user_id=second_user.id, probability=0.7))
+        await db.execute(
+            insert(Forecast),
+            [
+                {"prediction_id": prediction.id, "user_id": test_user.id, "probability": 0.3},
+                {"prediction_id": prediction.id, "user_id": second_user.id, "probability": 0.7},
+            ],
+        )
         await db.commit()
 
         response = await client.get(
@@ -340,6 +386,16 @@ class TestForecastEndpoints:
         assert response.status_code == 200
         assert len(response.json()) == 2
 
+    @pytest.mark.asyncio
+    async def test_list_forecasts_for_missing_prediction(
+        self, client: AsyncClient, auth_headers: dict
+    ):
+        response = await client.get(
+            "/api/forecasts/prediction/9999",
+            headers=auth_headers,
+        )
+        assert response.status_code == 404
+
     @pytest.mark.asyncio
     async def test_list_my_forecasts(
         self,
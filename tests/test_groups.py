@@ -3,6 +3,7 @@ from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Group, GroupMembership, GroupRole, User
+from app.routers.groups import join_attempts
 
 
 class TestGroupEndpoints:
@@ -21,6 +22,32 @@ class TestGroupEndpoints:
         assert "invite_code" in data
         assert len(data["invite_code"]) > 0
 
+    @pytest.mark.asyncio
+    async def test_create_group_retries_invite_code_collision(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        db: AsyncSession,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        db.add(Group(name="Existing", invite_code="taken-code"))
+        await db.commit()
+
+        codes = iter(["taken-code", "fresh-code"])
+        monkeypatch.setattr("app.routers.groups.generate_invite_code", lambda: next(codes))
+
+        response = await client.post(
+            "/api/groups",
+            headers=auth_headers,
+            json={"name": "Retry Group"},
+        )
+
+        assert response.status_code == 201
+        assert response.json()["invite_code"] == "fresh-code"
+
+        response = await client.get("/api/groups", headers=auth_headers)
+        assert [g["name"] for g in response.json()] == ["Retry Group"]
+
     @pytest.mark.asyncio
     async def test_create_group_unauthorized(self, client: AsyncClient):
         response = await client.post(
@@ -45,10 +72,9 @@ class TestGroupEndpoints:
         # Create a group with the user as admin
         group = Group(name="My Group")
         db.add(group)
-        await db.flush()
 
         membership = GroupMembership(
-            user_id=test_user.id, group_id=group.id, role=GroupRole.admin
+            user_id=test_user.id, group=group, role=GroupRole.admin
         )
         db.add(membership)
         await db.commit()
@@ -67,10 +93,9 @@ class TestGroupEndpoints:
     ):
         group = Group(name="Test Group")
         db.add(group)
-        await db.flush()
 
         membership = GroupMembership(
-            user_id=test_user.id, group_id=group.id, role=GroupRole.member
+            user_id=test_user.id, group=group, role=GroupRole.member
         )
         db.add(membership)
         await db.commit()
@@ -91,6 +116,71 @@ class TestGroupEndpoints:
         response = await client.get(f"/api/groups/{group.id}", headers=auth_headers)
         assert response.status_code == 404
 
+    @pytest.mark.asyncio
+    async def test_get_group_after_removal_skips_cached_listing(
+        self, client: AsyncClient, auth_headers: dict, test_user: User, db: AsyncSession
+    ):
+        group = Group(name="Removed")
+        db.add(group)
+        membership = GroupMembership(user_id=test_user.id, group=group, role=GroupRole.member)
+        db.add(membership)
+        await db.commit()
+
+        # Caches the listing, then removes the membership behind its back
+        await client.get("/api/groups", headers=auth_headers)
+        await db.delete(membership)
+        await db.commit()
+
+        response = await client.get(f"/api/groups/{group.id}", headers=auth_headers)
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_list_my_groups_paginates(
+        self, client: AsyncClient, auth_headers: dict, test_user: User, db: AsyncSession
+    ):
+        for name in ["One", "Two", "Three"]:
+            group = Group(name=name)
+            db.add(group)
+            db.add(GroupMembership(user_id=test_user.id, group=group, role=GroupRole.member))
+        await db.commit()
+
+        response = await client.get("/api/groups?limit=2", headers=auth_headers)
+        assert [g["name"] for g in response.json()] == ["One", "Two"]
+        cursor = response.headers["x-next-cursor"]
+
+        response = await client.get(
+            f"/api/groups?limit=2&after={cursor}", headers=auth_headers
+        )
+        assert [g["name"] for g in response.json()] == ["Three"]
+        assert "x-next-cursor" not in response.headers
+
+    @pytest.mark.asyncio
+    async def test_list_my_groups_reflects_join_and_leave(
+        self,
+        client: AsyncClient,
+        second_auth_headers: dict,
+        test_user: User,
+        db: AsyncSession,
+    ):
+        group = Group(name="Cache Test")
+        db.add(group)
+        db.add(GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin))
+        await db.commit()
+
+        response = await client.get("/api/groups", headers=second_auth_headers)
+        assert response.json() == []
+
+        await client.post(
+            f"/api/groups/join?invite_code={group.invite_code}",
+            headers=second_auth_headers,
+        )
+        response = await client.get("/api/groups", headers=second_auth_headers)
+        assert [g["name"] for g in response.json()] == ["Cache Test"]
+
+        await client.delete(f"/api/groups/{group.id}/leave", headers=second_auth_headers)
+        response = await client.get("/api/groups", headers=second_auth_headers)
+        assert response.json() == []
+
     @pytest.mark.asyncio
     async def test_join_group(
         self,
@@ -102,14 +192,12 @@ class TestGroupEndpoints:
         # Create a group with the first user
         group = Group(name="Join Test")
         db.add(group)
-        await db.flush()
 
         membership = GroupMembership(
-            user_id=test_user.id, group_id=group.id, role=GroupRole.admin
+            user_id=test_user.id, group=group, role=GroupRole.admin
         )
         db.add(membership)
         await db.commit()
-        await db.refresh(group)
 
         # Second user joins via invite code
         response = await client.post(
@@ -130,20 +218,43 @@ class TestGroupEndpoints:
         )
         assert response.status_code == 404
 
+    @pytest.mark.asyncio
+    async def test_join_group_rate_limited(
+        self, client: AsyncClient, auth_headers: dict, second_auth_headers: dict
+    ):
+        for _ in range(join_attempts.limit):
+            response = await client.post(
+                "/api/groups/join?invite_code=guess",
+                headers=auth_headers,
+            )
+            assert response.status_code == 404
+
+        response = await client.post(
+            "/api/groups/join?invite_code=guess",
+            headers=auth_headers,
+        )
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+
+        # Limits are per user
+        response = await client.post(
+            "/api/groups/join?invite_code=guess",
+            headers=second_auth_headers,
+        )
+        assert response.status_code == 404
+
     @pytest.mark.asyncio
     async def test_join_group_already_member(
         self, client: AsyncClient, auth_headers: dict, test_user: User, db: AsyncSession
     ):
         group = Group(name="Already Joined")
         db.add(group)
-        await db.flush()
 
         membership = GroupMembership(
-            user_id=test_user.id, group_id=group.id, role=GroupRole.member
+            user_id=test_user.id, group=group, role=GroupRole.member
         )
         db.add(membership)
         await db.commit()
-        await db.refresh(group)
 
         response = await client.post(
             f"/api/groups/join?invite_code={group.invite_code}",
@@ -162,11 +273,11 @@ class TestGroupEndpoints:
         db: AsyncSession,
     ):
         group = Group(name="Members Test")
-        db.add(group)
-        await db.flush()
-
-        db.add(GroupMembership(user_id=test_user.id, group_id=group.id, role=GroupRole.admin))
-        db.add(GroupMembership(user_id=second_user.id, group_id=group.id, role=GroupRole.member))
+        db.add_all([
+            group,
+            GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin),
+            GroupMembership(user_id=second_user.id, group=group, role=GroupRole.member),
+        ])
         await db.commit()
 
         response = await client.get(f"/api/groups/{group.id}/members", headers=auth_headers)
@@ -175,16 +286,32 @@ class TestGroupEndpoints:
         data = response.json()
         assert len(data) == 2
 
+    @pytest.mark.asyncio
+    async def test_list_group_members_not_member(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        second_user: User,
+        db: AsyncSession,
+    ):
+        group = Group(name="Members Hidden")
+        db.add(group)
+
+        db.add(GroupMembership(user_id=second_user.id, group=group, role=GroupRole.admin))
+        await db.commit()
+
+        response = await client.get(f"/api/groups/{group.id}/members", headers=auth_headers)
+        assert response.status_code == 404
+
     @pytest.mark.asyncio
     async def test_leave_group(
         self, client: AsyncClient, auth_headers: dict, test_user: User, db: AsyncSession
     ):
         group = Group(name="Leave Test")
         db.add(group)
-        await db.flush()
 
         membership = GroupMembership(
-            user_id=test_user.id, group_id=group.id, role=GroupRole.member
+            user_id=test_user.id, group=group, role=GroupRole.member
         )
         db.add(membership)
         await db.commit()
@@ -1,31 +1,62 @@
+from collections.abc import Awaitable, Callable
 from datetime import datetime, timedelta
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Group, GroupMembership, GroupRole, Prediction, PredictionStatus, User
+from app.models import (
+    Forecast,
+    Group,
+    GroupMembership,
+    GroupRole,
+    Prediction,
+    PredictionStatus,
+    User,
+)
 
-# Helper: far future date for tests
-FUTURE_DATE = datetime.utcnow() + timedelta(days=365)
+# Helper: fixed far-future date for tests, independent of import time
+FUTURE_DATE = datetime(2099, 1, 1)
 
 
 @pytest.fixture
 async def group_with_user(db: AsyncSession, test_user: User) -> Group:
     """Create a group with the test user as admin."""
     group = Group(name="Test Group")
-    db.add(group)
-    await db.flush()
-
-    membership = GroupMembership(
-        user_id=test_user.id, group_id=group.id, role=GroupRole.admin
-    )
-    db.add(membership)
+    db.add_all([
+        group,
+        GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin),
+    ])
     await db.commit()
-    await db.refresh(group)
     return group
 
 
+@pytest.fixture
+def prediction_factory(
+    db: AsyncSession, group_with_user: Group, test_user: User
+) -> Callable[..., Awaitable[Prediction]]:
+    """
+    Returns an async callable that adds a prediction to group_with_user.
+    It defaults to an open prediction by the test user; keyword arguments
+    override any column.
+    """
+
+    async def make(**fields) -> Prediction:
+        prediction = Prediction(**{
+            "group_id": group_with_user.id,
+            "creator_id": test_user.id,
+            "title": "Test Prediction",
+            "resolution_date": FUTURE_DATE,
+            **fields,
+        })
+        db.add(prediction)
+        await db.commit()
+        return prediction
+
+    return make
+
+
 class TestPredictionEndpoints:
     @pytest.mark.asyncio
     async def test_create_prediction(
@@ -74,15 +105,19 @@ class TestPredictionEndpoints:
         test_user: User,
         db: AsyncSession,
     ):
-        # Create some predictions
-        for i in range(3):
-            pred = Prediction(
-                group_id=group_with_user.id,
-                creator_id=test_user.id,
-                title=f"Prediction {i}",
-                resolution_date=FUTURE_DATE,
-            )
-            db.add(pred)
+        # Create some predictions; one bulk INSERT, as nothing reads them back
+        await db.execute(
+            insert(Prediction),
+            [
+                {
+                    "group_id": group_with_user.id,
+                    "creator_id": test_user.id,
+                    "title": f"Prediction {i}",
+                    "resolution_date": FUTURE_DATE,
+                }
+                for i in range(3)
+            ],
+        )
         await db.commit()
 
         response = await client.get(
@@ -93,6 +128,20 @@ class TestPredictionEndpoints:
         assert response.status_code == 200
         assert len(response.json()) == 3
 
+    @pytest.mark.asyncio
+    async def test_list_group_predictions_not_member(
+        self, client: AsyncClient, auth_headers: dict, db: AsyncSession
+    ):
+        group = Group(name="Other Group")
+        db.add(group)
+        await db.commit()
+
+        response = await client.get(
+            f"/api/predictions/group/{group.id}",
+            headers=auth_headers,
+        )
+        assert response.status_code == 403
+
     @pytest.mark.asyncio
     async def test_list_predictions_filter_by_status(
         self,
@@ -135,19 +184,9 @@ class TestPredictionEndpoints:
         self,
         client: AsyncClient,
         auth_headers: dict,
-        group_with_user: Group,
-        test_user: User,
-        db: AsyncSession,
+        prediction_factory: Callable[..., Awaitable[Prediction]],
     ):
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Get Test",
-            resolution_date=FUTURE_DATE,
-        )
-        db.add(pred)
-        await db.commit()
-        await db.refresh(pred)
+        pred = await prediction_factory(title="Get Test")
 
         response = await client.get(
             f"/api/predictions/{pred.id}",
@@ -167,183 +206,144 @@ class TestPredictionEndpoints:
         assert response.status_code == 404
 
     @pytest.mark.asyncio
-    async def test_resolve_prediction_as_creator(
+    @pytest.mark.parametrize(
+        ("creator", "caller", "initial_status", "outcome", "expected_status", "detail"),
+        [
+            ("test_user", "test_user", "open", "resolved_yes", 200, None),
+            # test_user is the group admin
+            ("second_user", "test_user", "open", "resolved_no", 200, None),
+            ("test_user", "second_user", "open", "resolved_yes", 403, None),
+            ("test_user", "test_user", "resolved_yes", "resolved_no", 400, "already resolved"),
+            ("test_user", "test_user", "open", "open", 400, "Cannot resolve to 'open'"),
+        ],
+        ids=["creator", "admin", "member", "already-resolved", "to-open"],
+    )
+    async def test_resolve_prediction(
         self,
         client: AsyncClient,
         auth_headers: dict,
+        second_auth_headers: dict,
+        prediction_factory: Callable[..., Awaitable[Prediction]],
         group_with_user: Group,
         test_user: User,
-        db: AsyncSession,
-    ):
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Resolve Test",
-            resolution_date=FUTURE_DATE,
-        )
-        db.add(pred)
-        await db.commit()
-        await db.refresh(pred)
-
-        response = await client.post(
-            f"/api/predictions/{pred.id}/resolve",
-            headers=auth_headers,
-            json={"outcome": "resolved_yes"},
-        )
-
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "resolved_yes"
-        assert data["resolved_at"] is not None
-
-    @pytest.mark.asyncio
-    async def test_resolve_prediction_as_admin(
-        self,
-        client: AsyncClient,
-        auth_headers: dict,
-        group_with_user: Group,
         second_user: User,
         db: AsyncSession,
+        creator: str,
+        caller: str,
+        initial_status: str,
+        outcome: str,
+        expected_status: int,
+        detail: str | None,
     ):
-        # Add second user as regular member
+        users = {"test_user": test_user, "second_user": second_user}
+        headers = {"test_user": auth_headers, "second_user": second_auth_headers}
+
+        # Second user joins as a regular member
         db.add(GroupMembership(
-            user_id=second_user.id,
-            group_id=group_with_user.id,
-            role=GroupRole.member,
+            user_id=second_user.id, group_id=group_with_user.id, role=GroupRole.member
         ))
-
-        # Second user creates prediction
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=second_user.id,
-            title="Admin Resolve Test",
-            resolution_date=FUTURE_DATE,
+        pred = await prediction_factory(
+            creator_id=users[creator].id, status=PredictionStatus(initial_status)
         )
-        db.add(pred)
-        await db.commit()
-        await db.refresh(pred)
 
-        # Admin (test_user) resolves it
         response = await client.post(
             f"/api/predictions/{pred.id}/resolve",
-            headers=auth_headers,
-            json={"outcome": "resolved_no"},
+            headers=headers[caller],
+            json={"outcome": outcome},
         )
 
-        assert response.status_code == 200
-        assert response.json()["status"] == "resolved_no"
+        assert response.status_code == expected_status
+        if expected_status == 200:
+            data = response.json()
+            assert data["status"] == outcome
+            assert data["resolved_at"] is not None
+        if detail is not None:
+            assert detail in response.json()["detail"]
 
     @pytest.mark.asyncio
-    async def test_resolve_prediction_not_authorized(
+    async def test_resolve_prediction_stores_locked_in_brier_scores(
         self,
         client: AsyncClient,
-        second_auth_headers: dict,
-        group_with_user: Group,
+        auth_headers: dict,
+        prediction_factory: Callable[..., Awaitable[Prediction]],
         test_user: User,
         second_user: User,
         db: AsyncSession,
     ):
-        # Add second user as regular member
-        db.add(GroupMembership(
-            user_id=second_user.id,
-            group_id=group_with_user.id,
-            role=GroupRole.member,
-        ))
-
-        # First user creates prediction
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Not Auth Test",
-            resolution_date=FUTURE_DATE,
+        # Lock-in is 75% of the way from creation to resolution: 1 day ago
+        now = datetime.utcnow()
+        pred = await prediction_factory(
+            created_at=now - timedelta(days=10), resolution_date=now + timedelta(days=2)
         )
-        db.add(pred)
-        await db.commit()
-        await db.refresh(pred)
-
-        # Second user (not creator, not admin) tries to resolve
-        response = await client.post(
-            f"/api/predictions/{pred.id}/resolve",
-            headers=second_auth_headers,
-            json={"outcome": "resolved_yes"},
+        locked_in = Forecast(
+            prediction_id=pred.id, user_id=test_user.id, probability=0.8,
+            created_at=now - timedelta(days=5),
         )
-
-        assert response.status_code == 403
-
-    @pytest.mark.asyncio
-    async def test_resolve_already_resolved(
-        self,
-        client: AsyncClient,
-        auth_headers: dict,
-        group_with_user: Group,
-        test_user: User,
-        db: AsyncSession,
-    ):
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Already Resolved",
-            status=PredictionStatus.resolved_yes,
-            resolution_date=FUTURE_DATE,
+        late = Forecast(
+            prediction_id=pred.id, user_id=second_user.id, probability=0.8,
+            created_at=now,
         )
-        db.add(pred)
+        db.add_all([locked_in, late])
         await db.commit()
-        await db.refresh(pred)
 
         response = await client.post(
             f"/api/predictions/{pred.id}/resolve",
             headers=auth_headers,
             json={"outcome": "resolved_no"},
         )
+        assert response.status_code == 200
 
-        assert response.status_code == 400
-        assert "already resolved" in response.json()["detail"]
+        scores = dict(
+            (await db.execute(
+                select(Forecast.user_id, Forecast.brier_score)
+                .where(Forecast.prediction_id == pred.id)
+            )).all()
+        )
+        assert abs(scores[test_user.id] - 0.64) < 0.001
+        assert scores[second_user.id] is None
 
     @pytest.mark.asyncio
-    async def test_resolve_to_open_not_allowed(
+    async def test_resolve_prediction_scores_forecast_just_before_lock_in(
         self,
         client: AsyncClient,
         auth_headers: dict,
-        group_with_user: Group,
+        prediction_factory: Callable[..., Awaitable[Prediction]],
         test_user: User,
         db: AsyncSession,
     ):
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Open Test",
-            resolution_date=FUTURE_DATE,
+        # Lock-in at 2.25ms past 2020-01-04; the forecast is in the same
+        # millisecond, but earlier
+        created = datetime(2020, 1, 1)
+        pred = await prediction_factory(
+            created_at=created,
+            resolution_date=created + timedelta(days=4, milliseconds=3),
         )
-        db.add(pred)
+        forecast = Forecast(
+            prediction_id=pred.id, user_id=test_user.id, probability=0.8,
+            created_at=created + timedelta(days=3, milliseconds=2),
+        )
+        db.add(forecast)
         await db.commit()
-        await db.refresh(pred)
 
         response = await client.post(
             f"/api/predictions/{pred.id}/resolve",
             headers=auth_headers,
-            json={"outcome": "open"},
+            json={"outcome": "resolved_no"},
         )
+        assert response.status_code == 200
 
-        assert response.status_code == 400
+        await db.refresh(forecast)
+        assert forecast.brier_score is not None
+        assert abs(forecast.brier_score - 0.64) < 0.001
 
     @pytest.mark.asyncio
     async def test_delete_prediction(
         self,
         client: AsyncClient,
         auth_headers: dict,
-        group_with_user: Group,
-        test_user: User,
-        db: AsyncSession,
+        prediction_factory: Callable[..., Awaitable[Prediction]],
     ):
-        pred = Prediction(
-            group_id=group_with_user.id,
-            creator_id=test_user.id,
-            title="Delete Test",
-            resolution_date=FUTURE_DATE,
-        )
-        db.add(pred)
-        await db.commit()
-        await db.refresh(pred)
+        pred = await prediction_factory(title="Delete Test")
 
         response = await client.delete(
             f"/api/predictions/{pred.id}",
@@ -9,44 +9,28 @@ from app.scoring import (
 
 
 class TestBrierScore:
-    def test_perfect_prediction_yes(self):
-        # Predicted 100%, outcome was yes
-        score = calculate_brier_score(1.0, PredictionStatus.resolved_yes)
-        assert score == 0.0
-
-    def test_perfect_prediction_no(self):
-        # Predicted 0%, outcome was no
-        score = calculate_brier_score(0.0, PredictionStatus.resolved_no)
-        assert score == 0.0
-
-    def test_worst_prediction_yes(self):
-        # Predicted 0%, outcome was yes
-        score = calculate_brier_score(0.0, PredictionStatus.resolved_yes)
-        assert score == 1.0
-
-    def test_worst_prediction_no(self):
-        # Predicted 100%, outcome was no
-        score = calculate_brier_score(1.0, PredictionStatus.resolved_no)
-        assert score == 1.0
-
-    def test_no_information_prediction_yes(self):
-        # Predicted 50%, outcome was yes
-        score = calculate_brier_score(0.5, PredictionStatus.resolved_yes)
-        assert score == 0.25
-
-    def test_no_information_prediction_no(self):
-        # Predicted 50%, outcome was no
-        score = calculate_brier_score(0.5, PredictionStatus.resolved_no)
-        assert score == 0.25
-
-    def test_typical_prediction(self):
-        # Predicted 70%, outcome was yes
-        score = calculate_brier_score(0.7, PredictionStatus.resolved_yes)
-        assert abs(score - 0.09) < 0.001
-
-    def test_ambiguous_returns_none(self):
-        score = calculate_brier_score(0.5, PredictionStatus.ambiguous)
-        assert score is None
+    @pytest.mark.parametrize(
+        "probability, outcome, expected",
+        [
+            pytest.param(1.0, PredictionStatus.resolved_yes, 0.0, id="perfect-yes"),
+            pytest.param(0.0, PredictionStatus.resolved_no, 0.0, id="perfect-no"),
+            pytest.param(0.0, PredictionStatus.resolved_yes, 1.0, id="worst-yes"),
+            pytest.param(1.0, PredictionStatus.resolved_no, 1.0, id="worst-no"),
+            # Predicting 50% carries no information
+            pytest.param(0.5, PredictionStatus.resolved_yes, 0.25, id="no-information-yes"),
+            pytest.param(0.5, PredictionStatus.resolved_no, 0.25, id="no-information-no"),
+            pytest.param(0.7, PredictionStatus.resolved_yes, 0.09, id="typical"),
+        ],
+    )
+    def test_resolved_prediction(
+        self, probability: float, outcome: PredictionStatus, expected: float
+    ):
+        score = calculate_brier_score(probability, outcome)
+        assert score == pytest.approx(expected)
+
+    @pytest.mark.parametrize("outcome", [PredictionStatus.ambiguous, PredictionStatus.open])
+    def test_unresolved_returns_none(self, outcome: PredictionStatus):
+        assert calculate_brier_score(0.5, outcome) is None
 
 
 class TestAverageBrierScore:
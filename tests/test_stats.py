@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import (
@@ -13,9 +14,10 @@ from app.models import (
     PredictionStatus,
     User,
 )
+from app.scoring import calculate_calibration_buckets, store_brier_scores
 
-# Helper: far future date for tests
-FUTURE_DATE = datetime.utcnow() + timedelta(days=365)
+# Helper: fixed far-future date for tests, independent of import time
+FUTURE_DATE = datetime(2099, 1, 1)
 
 
 @pytest.fixture
@@ -24,48 +26,54 @@ async def group_with_resolved_predictions(
 ) -> tuple[Group, list[Prediction]]:
     """Create a group with resolved predictions and forecasts."""
     group = Group(name="Stats Test Group")
-    db.add(group)
-    await db.flush()
-
-    db.add(GroupMembership(user_id=test_user.id, group_id=group.id, role=GroupRole.admin))
-    db.add(GroupMembership(user_id=second_user.id, group_id=group.id, role=GroupRole.member))
 
     # Create predictions
     pred1 = Prediction(
-        group_id=group.id,
+        group=group,
         creator_id=test_user.id,
         title="Resolved Yes",
         status=PredictionStatus.resolved_yes,
         resolution_date=FUTURE_DATE,
     )
     pred2 = Prediction(
-        group_id=group.id,
+        group=group,
         creator_id=test_user.id,
         title="Resolved No",
         status=PredictionStatus.resolved_no,
         resolution_date=FUTURE_DATE,
     )
     pred3 = Prediction(
-        group_id=group.id,
+        group=group,
         creator_id=test_user.id,
         title="Still Open",
         status=PredictionStatus.open,
         resolution_date=FUTURE_DATE,
     )
-    db.add_all([pred1, pred2, pred3])
-    await db.flush()
 
-    # Add forecasts
-    # test_user: 0.8 on yes (score 0.04), 0.2 on no (score 0.04) - avg 0.04
-    db.add(Forecast(prediction_id=pred1.id, user_id=test_user.id, probability=0.8))
-    db.add(Forecast(prediction_id=pred2.id, user_id=test_user.id, probability=0.2))
+    db.add_all([
+        group,
+        GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin),
+        GroupMembership(user_id=second_user.id, group=group, role=GroupRole.member),
+        pred1,
+        pred2,
+        pred3,
+    ])
+    await db.flush()
 
-    # second_user: 0.5 on yes (score 0.25), 0.5 on no (score 0.25) - avg 0.25
-    db.add(Forecast(prediction_id=pred1.id, user_id=second_user.id, probability=0.5))
-    db.add(Forecast(prediction_id=pred2.id, user_id=second_user.id, probability=0.5))
+    # Add forecasts in one executemany; nothing needs them loaded as objects
+    await db.execute(insert(Forecast), [
+        # test_user: 0.8 on yes (score 0.04), 0.2 on no (score 0.04) - avg 0.04
+        {"prediction_id": pred1.id, "user_id": test_user.id, "probability": 0.8},
+        {"prediction_id": pred2.id, "user_id": test_user.id, "probability": 0.2},
+        # second_user: 0.5 on yes (score 0.25), 0.5 on no (score 0.25) - avg 0.25
+        {"prediction_id": pred1.id, "user_id": second_user.id, "probability": 0.5},
+        {"prediction_id": pred2.id, "user_id": second_user.id, "probability": 0.5},
+    ])
 
+    # Score as resolving them through the API would
+    await db.execute(store_brier_scores(pred1.id))
+    await db.execute(store_brier_scores(pred2.id))
     await db.commit()
-    await db.refresh(group)
 
     return group, [pred1, pred2, pred3]
 
@@ -124,6 +132,108 @@ class TestStatsEndpoints:
         assert data[1]["rank"] == 2
         assert abs(data[1]["average_brier_score"] - 0.25) < 0.001
 
+    @pytest.mark.asyncio
+    async def test_get_leaderboard_not_modified(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        group_with_resolved_predictions: tuple[Group, list[Prediction]],
+    ):
+        group, _ = group_with_resolved_predictions
+        url = f"/api/stats/group/{group.id}/leaderboard"
+
+        response = await client.get(url, headers=auth_headers)
+        etag = response.headers["etag"]
+
+        response = await client.get(url, headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = await client.get(url, headers={**auth_headers, "If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert response.headers["etag"] == etag
+
+        # A list of tags, compared weakly
+        response = await client.get(
+            url, headers={**auth_headers, "If-None-Match": f'"stale", W/{etag}'}
+        )
+        assert response.status_code == 304
+
+    @pytest.mark.asyncio
+    async def test_get_leaderboard_refreshes_on_resolution(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        second_user: User,
+        db: AsyncSession,
+        group_with_resolved_predictions: tuple[Group, list[Prediction]],
+    ):
+        group, (_, _, open_pred) = group_with_resolved_predictions
+        db.add(Forecast(prediction=open_pred, user_id=second_user.id, probability=1.0))
+        await db.commit()
+        url = f"/api/stats/group/{group.id}/leaderboard"
+
+        response = await client.get(url, headers=auth_headers)
+        assert abs(response.json()[1]["average_brier_score"] - 0.25) < 0.001
+
+        await client.post(
+            f"/api/predictions/{open_pred.id}/resolve",
+            headers=auth_headers,
+            json={"outcome": "resolved_yes"},
+        )
+
+        # The cached leaderboard is dropped; second_user's perfect forecast counts
+        response = await client.get(url, headers=auth_headers)
+        assert abs(response.json()[1]["average_brier_score"] - 0.5 / 3) < 0.001
+
+    @pytest.mark.asyncio
+    async def test_get_leaderboard_counts_locked_in_forecasts_only(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_user: User,
+        second_user: User,
+        db: AsyncSession,
+    ):
+        group = Group(name="Lock-in Group")
+        db.add(group)
+        db.add(GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin))
+        db.add(GroupMembership(user_id=second_user.id, group=group, role=GroupRole.member))
+
+        # Lock-in is 75% of the way from creation to resolution: 4 days ago
+        now = datetime.utcnow()
+        pred = Prediction(
+            group=group,
+            creator_id=test_user.id,
+            title="Past",
+            status=PredictionStatus.resolved_yes,
+            created_at=now - timedelta(days=10),
+            resolution_date=now - timedelta(days=2),
+        )
+        db.add(pred)
+        db.add(Forecast(
+            prediction=pred, user_id=test_user.id, probability=0.9,
+            created_at=now - timedelta(days=9),
+        ))
+        db.add(Forecast(
+            prediction=pred, user_id=second_user.id, probability=1.0,
+            created_at=now - timedelta(days=3),
+        ))
+        await db.flush()
+        await db.execute(store_brier_scores(pred.id))
+        await db.commit()
+
+        response = await client.get(
+            f"/api/stats/group/{group.id}/leaderboard",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [entry["user_id"] for entry in data] == [test_user.id]
+        assert data[0]["forecast_count"] == 1
+        assert abs(data[0]["average_brier_score"] - 0.01) < 0.001
+
     @pytest.mark.asyncio
     async def test_get_leaderboard_not_member(
         self, client: AsyncClient, auth_headers: dict, db: AsyncSession
@@ -152,6 +262,21 @@ class TestStatsEndpoints:
         # We have forecasts at 0.8 and 0.2, so should have 2 buckets
         assert len(data) >= 1
 
+    @pytest.mark.asyncio
+    async def test_get_my_calibration_matches_python_bucketing(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        group_with_resolved_predictions: tuple[Group, list[Prediction]],
+    ):
+        response = await client.get("/api/stats/me/calibration", headers=auth_headers)
+
+        expected = calculate_calibration_buckets([
+            (0.8, PredictionStatus.resolved_yes),
+            (0.2, PredictionStatus.resolved_no),
+        ])
+        assert response.json() == [bucket.model_dump() for bucket in expected]
+
     @pytest.mark.asyncio
     async def test_get_user_stats_in_group(
         self,
@@ -184,8 +309,7 @@ class TestStatsEndpoints:
         # Create a group with test_user
         group = Group(name="My Group")
         db.add(group)
-        await db.flush()
-        db.add(GroupMembership(user_id=test_user.id, group_id=group.id, role=GroupRole.admin))
+        db.add(GroupMembership(user_id=test_user.id, group=group, role=GroupRole.admin))
 
         # Create another user not in the group
         other_user = User(email="other@example.com")
@@ -0,0 +1,31 @@
+from app.templating import bump_group_version, environment, warm_templates
+
+FRAGMENT = environment.from_string(
+    "{% cache 30, 'test', group_id, group_version(group_id) %}{{ value }}{% endcache %}"
+)
+
+
+class TestFragmentCache:
+    def test_cached_fragment_is_reused(self):
+        assert FRAGMENT.render(group_id=1, value="first") == "first"
+        assert FRAGMENT.render(group_id=1, value="second") == "first"
+
+        # Other keys render on their own
+        assert FRAGMENT.render(group_id=2, value="other") == "other"
+
+    def test_group_version_bump_invalidates(self):
+        assert FRAGMENT.render(group_id=1, value="before") == "before"
+
+        bump_group_version(1)
+        assert FRAGMENT.render(group_id=1, value="after") == "after"
+
+    def test_fragment_output_is_escaped(self):
+        assert FRAGMENT.render(group_id=3, value="<b>") == "&lt;b&gt;"
+
+
+class TestWarmTemplates:
+    def test_every_page_template_is_loaded(self):
+        warm_templates()
+
+        cached = {name for _, name in environment.cache.keys()}
+        assert {"feed.html", "partials/forecasts_list.html"} <= cached